@@ -0,0 +1,80 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Season backfill: build the rot{date}.json files for a range of days.
+
+Pages are downloaded by a pool of threads while the box scores are parsed
+by a pool of processes, a few days ahead of the day being written.  Days
+that already have a day file are skipped, and day files are written
+atomically, so an interrupted backfill can simply be run again.
+
+Usage: python backfill.py yyyymmdd yyyymmdd
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from get_latest_games import get_recent_games, filter_al_teams_from_boxscores
+from get_latest_games import get_team_directory, day_file_path
+from update_player_stats_for_day import BOX_SCORE_WORKERS, box_url
+from update_player_stats_for_day import box_records, write_day_file
+from season_store import update_season_store
+from web_pages import get_page
+
+DAYS_AHEAD = 3
+
+def fetch_day(fetcher, gdate, team_data):
+    """
+    Queue the downloads for a day.  Returns a future of the list of
+    futures of the day's box score pages (in game order).
+    """
+    def queue_box_pages():
+        glist = filter_al_teams_from_boxscores(get_recent_games(gdate),
+                                               team_data)
+        return [fetcher.submit(get_page, box_url(game)) for game in glist]
+    return fetcher.submit(queue_box_pages)
+
+def backfill(start_date, end_date, processes=None,
+             fetch_workers=BOX_SCORE_WORKERS):
+    """
+    Create the missing day files for the days from start_date to end_date
+    (inclusive, yyyymmdd format).
+
+    Input:
+        processes -- Number of parsing processes (default: one per cpu)
+        fetch_workers -- Number of download threads
+    """
+    dval = datetime.strptime(start_date, "%Y%m%d")
+    enddate = datetime.strptime(end_date, "%Y%m%d")
+    dates = []
+    while dval <= enddate:
+        gdate = dval.strftime("%Y%m%d")
+        if not os.path.exists(day_file_path(gdate)):
+            dates.append(gdate)
+        dval += timedelta(1)
+    team_data = get_team_directory()
+    written = []
+    with ThreadPoolExecutor(max_workers=fetch_workers + 1) as fetcher, \
+            ProcessPoolExecutor(max_workers=processes) as parser:
+        queued = {}
+        for indx, gdate in enumerate(dates):
+            for ahead in dates[indx:indx + DAYS_AHEAD + 1]:
+                if ahead not in queued:
+                    queued[ahead] = fetch_day(fetcher, ahead, team_data)
+            pages = queued.pop(gdate).result()
+            if not pages:
+                continue
+            parsed = [parser.submit(box_records, page.result(), team_data)
+                      for page in pages]
+            all_stats = []
+            for records in parsed:
+                all_stats.extend(records.result())
+            write_day_file(gdate, all_stats)
+            written.append(gdate)
+            print(f"Wrote rot{gdate}.json ({len(all_stats)} records)")
+    if written:
+        update_season_store(written[0])
+
+if __name__ == "__main__":
+    backfill(sys.argv[1], sys.argv[2])
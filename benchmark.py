@@ -0,0 +1,445 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Benchmarks.  Everything runs offline.
+
+The pipeline benchmark replays a day of pages (the team page, a day's
+scoreboard and its box scores) and a synthetic season of day files, and
+times each stage: fetch (from the page cache), parse, format, writing a
+day, aggregating ranges and the report.  The pages are generated by
+fixture_pages unless a fixture file of real pages, saved by
+record_fixtures, is given.  It runs in a scratch directory laid out like
+the real one, so the data directory is never touched.
+
+The startup benchmark times importing each entry point module in a fresh
+interpreter and lists the heavy dependencies that the import pulled in.
+
+Usage: python benchmark.py [results.json [baseline.json [fixtures.json.gz]]]
+"""
+import os
+import io
+import sys
+import gzip
+import json
+import time
+import random
+import subprocess
+import platform
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+from web_pages import PAGE_CACHE_DIR, get_page, cbs_url, set_offline
+from web_pages import save_cached_page
+from get_latest_games import TEAM_DIRECTORY, get_team_directory
+from get_latest_games import get_recent_games, filter_al_teams_from_boxscores
+from update_player_stats_for_day import BOX_PARSERS, STEAL_CLASS
+from update_player_stats_for_day import parse_box_page, format_records
+from update_player_stats_for_day import box_url, update_latest_games
+from update_player_stats_for_day import write_day_file
+from season_store import rebuild_season_store, range_frames, read_snapshot
+from day_columns import range_totals
+from roster_index import ROSTER_INDEX
+from free_agent_report import get_stats_in_range, report_free_agents_in_range
+from free_agent_report import collect_frames_free_agents, leaderboard
+from free_agent_report import limit_list, DISP_TABLES, SORT_ORDER, FUNC_TABLE
+from free_agent_report import TABLE_LENGTH, collect_stats_free_agents
+from fixture_pages import make_fixtures
+
+FIXTURE_FILE = os.sep.join(["..", "data", "bench", "fixtures.json.gz"])
+SEASON_START = "20220407"
+SEASON_DAYS = 180
+SEASON_SEED = 2022
+SEASON_TEAMS = ['BAL', 'BOS', 'CHW', 'CLE', 'DET', 'HOU', 'KC', 'LAA',
+                'MIN', 'NYY', 'OAK', 'SEA', 'TB', 'TEX', 'TOR']
+FIELD_POSITIONS = ['C', '1B', '2B', '3B', 'SS', 'LF', 'CF', 'RF', 'DH']
+ENTRY_POINTS = ["roto_gnus", "free_agent_report",
+                "update_player_stats_for_day", "get_latest_games",
+                "get_cbs_league", "backfill"]
+HEAVY_MODULES = ["pandas", "numpy", "bs4", "lxml", "requests", "selenium",
+                 "webdriver_manager", "yaml"]
+STARTUP_SCRIPT = ("import sys, time\n"
+                  "start = time.perf_counter()\n"
+                  "import {0}\n"
+                  "print(time.perf_counter() - start, "
+                  "*sorted(set(sys.modules) & set({1!r})))")
+
+def saved_box_pages(limit=None):
+    """
+    Return the html of box score pages found in the page cache (at most
+    limit of them)
+    """
+    pages = []
+    if not os.path.isdir(PAGE_CACHE_DIR):
+        return pages
+    for fname in sorted(os.listdir(PAGE_CACHE_DIR)):
+        if not fname.endswith(".html.gz"):
+            continue
+        with gzip.open(os.sep.join([PAGE_CACHE_DIR, fname]), "rt",
+                       encoding="utf8") as fdesc:
+            page = fdesc.read()
+        if STEAL_CLASS in page:
+            pages.append(page)
+        if limit and len(pages) >= limit:
+            break
+    return pages
+
+def bench_box_parsers(pages=None, repeat=3):
+    """
+    Time every box score parser backend over the same pages (best of
+    repeat runs) and check that each one produces the same raw data as
+    the full BeautifulSoup parser.  pages defaults to the box scores in
+    the page cache, or the generated fixture pages if there are none.
+
+    Returns: dictionary indexed by backend name of seconds per page,
+             speedup relative to "soup", and whether the output matched
+    """
+    if pages is None:
+        pages = saved_box_pages()
+    if not pages:
+        fixtures = make_fixtures()
+        pages = [fixtures["pages"][url] for url in fixtures["boxes"]]
+    expected = [parse_box_page(page, "soup") for page in pages]
+    results = {}
+    for name in BOX_PARSERS:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = [parse_box_page(page, name) for page in pages]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {"seconds_per_page": best / len(pages),
+                         "same_output": output == expected}
+    for name in results:
+        results[name]["speedup"] = (results["soup"]["seconds_per_page"] /
+                                    results[name]["seconds_per_page"])
+    return results
+
+def record_fixtures(gdate, fixture_file=FIXTURE_FILE):
+    """
+    Save the team page, the scoreboard for gdate and the AL box scores
+    played that day in fixture_file.  Pages already in the page cache are
+    not downloaded again.
+    """
+    urls = [cbs_url("/mlb/teams/"), cbs_url(f"/mlb/scoreboard/{gdate}")]
+    pages = {url: get_page(url) for url in urls}
+    glist = filter_al_teams_from_boxscores(get_recent_games(gdate,
+                                                            force=True))
+    for game in glist:
+        pages[box_url(game)] = get_page(box_url(game))
+    os.makedirs(os.path.dirname(fixture_file), exist_ok=True)
+    with gzip.open(fixture_file, "wt", encoding="utf8") as fdesc:
+        json.dump({"date": gdate, "boxes": [box_url(game) for game in glist],
+                   "pages": pages}, fdesc)
+
+def read_fixtures(fixture_file=FIXTURE_FILE):
+    """
+    Return the contents of fixture_file, or None if it does not exist
+    """
+    if not os.path.exists(fixture_file):
+        return None
+    with gzip.open(fixture_file, "rt", encoding="utf8") as fdesc:
+        return json.load(fdesc)
+
+def clear_memory_caches():
+    """
+    Forget the team directory, roster index and snapshots kept in memory,
+    which belong to whichever data directory was used last
+    """
+    TEAM_DIRECTORY.clear()
+    ROSTER_INDEX.clear()
+    read_snapshot.cache_clear()
+
+@contextlib.contextmanager
+def bench_workspace():
+    """
+    Run the enclosed code offline in a scratch src directory, next to an
+    empty scratch data directory
+    """
+    old_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.makedirs(os.sep.join([scratch, "data"]))
+        os.makedirs(os.sep.join([scratch, "src"]))
+        os.chdir(os.sep.join([scratch, "src"]))
+        clear_memory_caches()
+        set_offline(True)
+        try:
+            yield
+        finally:
+            set_offline(False)
+            clear_memory_caches()
+            os.chdir(old_dir)
+
+def timed(stages, name, items, func, *args):
+    """
+    Run func(*args) with stdout discarded, record its time in stages under
+    name (with the number of items processed) and return its result
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    elapsed = time.perf_counter() - start
+    stages[name] = {"seconds": elapsed, "items": items,
+                    "per_second": items / elapsed if elapsed else None}
+    return result
+
+def synthetic_player(rand, number, team, pitcher):
+    """
+    Return the identity of a made up player
+    """
+    return {"number": str(number),
+            "name": f"{rand.choice('ABCDEFGHJKLMNPRSTW')}. Player{number}",
+            "team": team, "pos": 'P' if pitcher else
+            rand.choice(FIELD_POSITIONS)}
+
+def synthetic_day(rand, players):
+    """
+    Return a day of records shaped like the ones format_records produces,
+    with every team playing (some batters pinch hit or switch positions)
+    """
+    day_stats = []
+    for team in SEASON_TEAMS:
+        for batter in rand.sample(players[team]["Bat"], 9):
+            if rand.random() < 0.1:
+                batter = {**batter, "pos": rand.choice(
+                    [f"PH-{batter['pos']}",
+                     f"{batter['pos']}-{rand.choice(FIELD_POSITIONS)}"])}
+            abv = rand.randint(2, 5)
+            hits = rand.randint(0, abv)
+            day_stats.append({**batter, "AB": abv, "R": rand.randint(0, 2),
+                              "H": hits, "RBI": rand.randint(0, 3),
+                              "HR": rand.randint(0, min(hits, 1)),
+                              "SB": int(rand.random() < 0.05)})
+        for pitcher in rand.sample(players[team]["Pit"], 3):
+            day_stats.append({**pitcher, "W": int(rand.random() < 0.15),
+                              "S": int(rand.random() < 0.05),
+                              "outs": rand.randint(1, 18),
+                              "H": rand.randint(0, 6),
+                              "ER": rand.randint(0, 4),
+                              "BB": rand.randint(0, 3),
+                              "KS": rand.randint(0, 8)})
+    return day_stats
+
+def make_synthetic_season(days=SEASON_DAYS, start=SEASON_START,
+                          seed=SEASON_SEED):
+    """
+    Write days of synthetic day files starting at start, and a league.json
+    with about half of the players on roto teams.  Returns the last date.
+    """
+    rand = random.Random(seed)
+    players = {}
+    number = 100000
+    for team in SEASON_TEAMS:
+        players[team] = {"Bat": [], "Pit": []}
+        for indx in range(26):
+            number += 1
+            posv = "Pit" if indx >= 13 else "Bat"
+            players[team][posv].append(synthetic_player(rand, number, team,
+                                                        posv == "Pit"))
+    rosters = {}
+    for team in SEASON_TEAMS:
+        for player in players[team]["Bat"] + players[team]["Pit"]:
+            if rand.random() < 0.5:
+                rosters.setdefault(str(rand.randint(1, 12)), []).append(
+                    {"number": player["number"], "name": player["name"]})
+    with open(os.sep.join(["..", "data", "league.json"]), "w",
+              encoding="utf8") as fdesc:
+        json.dump({"rosters": rosters}, fdesc)
+    dval = datetime.strptime(start, "%Y%m%d")
+    for _ in range(days):
+        write_day_file(dval.strftime("%Y%m%d"), synthetic_day(rand, players))
+        dval += timedelta(1)
+    return (dval - timedelta(1)).strftime("%Y%m%d")
+
+def bench_fixture_stages(stages, fixtures):
+    """
+    Time the stages that work on the recorded pages
+    """
+    for url, page in fixtures["pages"].items():
+        save_cached_page(url, page)
+    urls = list(fixtures["pages"])
+    timed(stages, "fetch", len(urls), lambda: [get_page(url) for url in urls])
+    team_data = get_team_directory()
+    pages = [fixtures["pages"][url] for url in fixtures["boxes"]]
+    raw_data = timed(stages, "parse", len(pages),
+                     lambda: [parse_box_page(page) for page in pages])
+    records = timed(stages, "format", len(raw_data),
+                    lambda: [format_records(raw, team_data)
+                             for raw in raw_data])
+    timed(stages, "day", sum(len(entry) for entry in records),
+          update_latest_games, fixtures["date"])
+
+def bench_season_stages(stages, days):
+    """
+    Time the stages that work on a synthetic season of day files
+    """
+    end = make_synthetic_season(days)
+    timed(stages, "store_rebuild", days, rebuild_season_store)
+    timed(stages, "aggregate_days", days, get_stats_in_range,
+          SEASON_START, end)
+    timed(stages, "aggregate_store", days, range_frames, SEASON_START, end)
+    timed(stages, "aggregate_columns", days, range_totals, SEASON_START, end)
+    stages["aggregate_store"]["same_output"] = store_matches_columns(
+        [(end, end), (SEASON_START, end)])
+    timed(stages, "adjusted_stats", days, collect_frames_free_agents,
+          SEASON_START, end)
+    stages["adjusted_stats"]["same_output"] = frames_match_lists(
+        [(end, end), (SEASON_START, end)])
+    timed(stages, "report", days, report_free_agents_in_range,
+          SEASON_START, end)
+    with contextlib.redirect_stdout(io.StringIO()):
+        stages["leaderboard"] = bench_leaderboards(
+            [collect_frames_free_agents(start, end)
+             for start in [end, SEASON_START]])
+
+def store_matches_columns(windows):
+    """
+    Return True if the season store gives the same players, summed stats
+    and positions as the columnar day files for every window (players may
+    be listed in another order)
+    """
+    for start, end in windows:
+        store = range_frames(start, end)[0]
+        columns = range_totals(start, end)[0]
+        for posv, frame in store.items():
+            expected = columns[posv].loc[frame.index]
+            if (len(frame) != len(columns[posv]) or
+                    not frame.drop(columns=['name', 'team', 'pos']).equals(
+                        expected.drop(columns=['name', 'team', 'pos'])) or
+                    [set(pos.split("-")) for pos in frame['pos']] !=
+                    [set(pos.split("-")) for pos in expected['pos']]):
+                return False
+    return True
+
+def frames_match_lists(windows):
+    """
+    Return True if collect_frames_free_agents (add_adjusted_stats on the
+    season store) gives every free agent the same counting and adjusted
+    stats as collect_stats_free_agents (get_bat_list and get_pit_list on
+    the day files) for every window
+    """
+    for start, end in windows:
+        lists = collect_stats_free_agents(start, end)
+        frames = collect_frames_free_agents(start, end)
+        for players, frame in zip(lists, [frames["Bat"], frames["Pit"]]):
+            stats = frame.drop(columns=['name', 'team', 'pos'])
+            if (len(players) != len(frame) or
+                    any(player["number"] not in stats.index or
+                        stats.loc[player["number"]].to_dict() !=
+                        {stat: player[stat] for stat in stats.columns}
+                        for player in players)):
+                return False
+    return True
+
+def sorted_leaderboard(frame, stat, descending, func):
+    """
+    Return the report table for stat the way it used to be built: a
+    stable sort of the whole filtered frame, then its first rows
+    """
+    return limit_list(frame, stat, func=func).sort_values(
+        stat, ascending=not descending, kind="stable").head(TABLE_LENGTH)
+
+def bench_leaderboards(frame_sets, repeat=3):
+    """
+    Time leaderboard against sorted_leaderboard for every report table of
+    each set of free agent frames in frame_sets (best of repeat runs), and
+    check that the tables are identical.  The stats of a one day range
+    are mostly ties, so such a set checks that tied players come out in
+    the same order.
+
+    Returns: dictionary of the seconds taken by each, the speedup and
+             whether the output matched
+    """
+    tables = [(frames[posv], stat, SORT_ORDER[ptype][count][1],
+               FUNC_TABLE[ptype][count])
+              for frames in frame_sets
+              for ptype, posv in enumerate(["Bat", "Pit"])
+              for count, stat in enumerate(DISP_TABLES[ptype])]
+    results = {}
+    for name, func in [["leaderboard", leaderboard],
+                       ["sorted", sorted_leaderboard]]:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = [func(*table) for table in tables]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = (best, output)
+    return {"seconds": results["leaderboard"][0],
+            "sort_seconds": results["sorted"][0],
+            "speedup": results["sorted"][0] / results["leaderboard"][0],
+            "same_output": all(
+                new.equals(old) for new, old in zip(results["leaderboard"][1],
+                                                    results["sorted"][1]))}
+
+def bench_pipeline(fixture_file=None, days=SEASON_DAYS):
+    """
+    Run all the stage benchmarks.  The fixture stages replay the pages
+    recorded in fixture_file if one is given, and generated pages
+    otherwise.
+
+    Returns: dictionary of run information and, indexed by stage name,
+             the seconds taken, items processed and items per second
+    """
+    fixtures = read_fixtures(fixture_file) if fixture_file else make_fixtures()
+    if fixtures is None:
+        raise FileNotFoundError(fixture_file)
+    stages = {}
+    with bench_workspace():
+        bench_fixture_stages(stages, fixtures)
+        stages["box_parsers"] = bench_box_parsers(
+            [fixtures["pages"][url] for url in fixtures["boxes"]])
+        bench_season_stages(stages, days)
+    return {"created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "fixture_file": fixture_file,
+            "fixture_date": fixtures["date"],
+            "season_days": days, "stages": stages,
+            "startup": bench_startup()}
+
+def bench_startup(modules=None, repeat=5):
+    """
+    Time importing each entry point module in a fresh interpreter (best of
+    repeat runs).
+
+    Returns: dictionary indexed by module name of the seconds the import
+             took and the HEAVY_MODULES it loaded
+    """
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in modules or ENTRY_POINTS:
+        best = None
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c",
+                 STARTUP_SCRIPT.format(module, HEAVY_MODULES)],
+                cwd=code_dir, capture_output=True, text=True,
+                check=True).stdout.split()
+            seconds = float(output[0])
+            best = seconds if best is None else min(best, seconds)
+        results[module] = {"seconds": best, "heavy_modules": output[1:]}
+    return results
+
+def compare_results(results, baseline):
+    """
+    Return the ratio of new to old seconds for every stage (and startup)
+    timed in both results and baseline (below 1 is faster)
+    """
+    retv = {}
+    for section in ["stages", "startup"]:
+        for name, entry in results.get(section, {}).items():
+            old = baseline.get(section, {}).get(name, {})
+            if "seconds" in entry and "seconds" in old:
+                retv[f"{section}:{name}"] = entry["seconds"] / old["seconds"]
+    return retv
+
+if __name__ == "__main__":
+    RESULTS = bench_pipeline(sys.argv[3] if len(sys.argv) > 3 else None)
+    print(json.dumps(RESULTS, indent=2))
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "w", encoding="utf8") as out_file:
+            json.dump(RESULTS, out_file, indent=2)
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "r", encoding="utf8") as in_file:
+            print(json.dumps(compare_results(RESULTS, json.load(in_file)),
+                             indent=2))
@@ -0,0 +1,249 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Columnar storage for the daily player stats.
+
+Next to every rot{date}.json file a rot{date}.npy file holds the same
+records as a NumPy structured array (one fixed width row per record), so
+that ranges of days can be memory mapped and summed as arrays without
+building a Python dict for every record.
+"""
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+
+DATA_DIR = os.sep.join(["..", "data"])
+STAT_FIELDS = ['AB', 'R', 'H', 'RBI', 'HR', 'SB', 'W', 'S', 'outs', 'ER',
+               'BB', 'KS']
+BAT_STATS = ['AB', 'R', 'H', 'RBI', 'HR', 'SB']
+PIT_STATS = ['W', 'S', 'outs', 'H', 'ER', 'BB', 'KS']
+HITTING = 0
+PITCHING = 1
+DAY_DTYPE = np.dtype([('number', 'U10'), ('name', 'U64'), ('team', 'U4'),
+                      ('pos', 'U24'), ('kind', 'i1')] +
+                     [(stat, 'i2') for stat in STAT_FIELDS])
+
+def columns_path(gdate):
+    """
+    Return the path of the columnar file for gdate (yyyymmdd format)
+    """
+    return os.sep.join([DATA_DIR, f"rot{gdate}.npy"])
+
+def list_dates(directory, prefix):
+    """
+    Return the sorted dates of the {prefix}{date}.json files in directory
+    """
+    if not os.path.isdir(directory):
+        return []
+    plen = len(prefix)
+    return sorted(fname[plen:-5] for fname in os.listdir(directory)
+                  if fname.startswith(prefix) and fname.endswith(".json"))
+
+def records_to_columns(day_stats):
+    """
+    Convert a list of player records (as written to rot{date}.json) to a
+    structured array.  Records with an 'AB' stat are hitting records, the
+    others are pitching records.
+
+    Raises ValueError if a string is too long for its field (numpy would
+    otherwise truncate it without a word).
+    """
+    arr = np.zeros(len(day_stats), dtype=DAY_DTYPE)
+    for indx, entry in enumerate(day_stats):
+        row = arr[indx]
+        for field in ['number', 'name', 'team', 'pos']:
+            if len(entry[field]) > DAY_DTYPE[field].itemsize // 4:
+                raise ValueError(f"{field} {entry[field]!r} is longer than "
+                                 f"the {DAY_DTYPE[field].str} column")
+            row[field] = entry[field]
+        row['kind'] = HITTING if 'AB' in entry else PITCHING
+        for stat in BAT_STATS if 'AB' in entry else PIT_STATS:
+            row[stat] = entry[stat]
+    return arr
+
+def columns_to_records(arr):
+    """
+    Convert a structured array back to the list of player records it was
+    made from
+    """
+    retv = []
+    for row in arr:
+        entry = {field: str(row[field])
+                 for field in ['number', 'name', 'team', 'pos']}
+        stats = BAT_STATS if row['kind'] == HITTING else PIT_STATS
+        for stat in stats:
+            entry[stat] = int(row[stat])
+        retv.append(entry)
+    return retv
+
+def save_day_columns(gdate, day_stats):
+    """
+    Write the records for a day to rot{gdate}.npy.  The temporary file is
+    named for the process and thread, since a missing file can be created
+    by several report threads at once.
+    """
+    out_path = columns_path(gdate)
+    tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as fdesc:
+        np.save(fdesc, records_to_columns(day_stats))
+    os.replace(tmp_path, out_path)
+
+def load_day_columns(gdate):
+    """
+    Return the records for a day as a (memory mapped) structured array.
+    A missing rot{gdate}.npy file, or one written with an older DAY_DTYPE,
+    is created from rot{gdate}.json first.
+    Returns None if there is no data for the day.
+    """
+    json_path = os.sep.join([DATA_DIR, f"rot{gdate}.json"])
+    if os.path.exists(columns_path(gdate)):
+        arr = np.load(columns_path(gdate), mmap_mode='r')
+        if arr.dtype == DAY_DTYPE or not os.path.exists(json_path):
+            return arr
+    elif not os.path.exists(json_path):
+        return None
+    with open(json_path, "r", encoding="utf8") as fdesc:
+        save_day_columns(gdate, json.load(fdesc))
+    return np.load(columns_path(gdate), mmap_mode='r')
+
+def convert_day_files(overwrite=False):
+    """
+    One shot conversion of existing rot{date}.json files to the columnar
+    format.  Days already converted are skipped unless overwrite is set.
+    """
+    for fname in sorted(os.listdir(DATA_DIR)):
+        if not (fname.startswith("rot") and fname.endswith(".json")):
+            continue
+        gdate = fname[3:-5]
+        if overwrite or not os.path.exists(columns_path(gdate)):
+            with open(os.sep.join([DATA_DIR, fname]), "r",
+                      encoding="utf8") as fdesc:
+                save_day_columns(gdate, json.load(fdesc))
+
+def load_dated_columns(start_date, end_date):
+    """
+    Return one structured array holding the records of every day in the
+    range (inclusive), in date order, an array holding the date (as a
+    yyyymmdd integer) of each record, and the timedelta spanned
+    """
+    dval = datetime.strptime(start_date, "%Y%m%d")
+    enddate = datetime.strptime(end_date, "%Y%m%d") + timedelta(1)
+    date_diff = enddate - dval
+    parts = []
+    dates = []
+    while dval != enddate:
+        arr = load_day_columns(dval.strftime("%Y%m%d"))
+        if arr is not None:
+            parts.append(arr)
+            dates.append(np.full(len(arr), int(dval.strftime("%Y%m%d"))))
+        dval += timedelta(1)
+    if not parts:
+        return (np.zeros(0, dtype=DAY_DTYPE), np.zeros(0, dtype=np.int64),
+                date_diff)
+    return np.concatenate(parts), np.concatenate(dates), date_diff
+
+def range_totals(start_date, end_date):
+    """
+    Columnar counterpart of free_agent_report.get_stats_in_range.
+
+    Returns a dict of two DataFrames ("Bat" and "Pit") indexed by player
+    number holding name, team, pos and the summed counting stats, and the
+    timedelta spanned.  Batters and pitchers are split as in
+    get_stats_on_date (pitchers' hitting lines are ignored), players are
+    listed in the order they first appear in the range, name and team
+    come from the first record in the range, and pos joins the distinct
+    positions played with "-".
+    """
+    return windows_totals([(start_date, end_date)])[0]
+
+def windows_totals(windows):
+    """
+    Return the range_totals results for every (start_date, end_date)
+    window in windows.  The day files of the range covering all of the
+    windows are read once, one day at a time, and each day is added to
+    the running totals of the windows it falls in, so memory use depends
+    on the number of players rather than the length of the range.
+    """
+    totals = [empty_totals() for _ in windows]
+    dval = datetime.strptime(min(wind[0] for wind in windows), "%Y%m%d")
+    enddate = datetime.strptime(max(wind[1] for wind in windows), "%Y%m%d")
+    while dval <= enddate:
+        gdate = dval.strftime("%Y%m%d")
+        arr = load_day_columns(gdate)
+        if arr is not None:
+            for (start_date, end_date), running in zip(windows, totals):
+                if start_date <= gdate <= end_date:
+                    add_day_totals(running, arr)
+        dval += timedelta(1)
+    return [(totals_frames(running),
+             datetime.strptime(end_date, "%Y%m%d") + timedelta(1) -
+             datetime.strptime(start_date, "%Y%m%d"))
+            for (start_date, end_date), running in zip(windows, totals)]
+
+def kind_rows(arr):
+    """
+    Return the "Bat" and "Pit" parts of a structured array, each with the
+    stats summed for it
+    """
+    return [["Bat", arr[(arr['kind'] == HITTING) & (arr['pos'] != 'P')],
+             BAT_STATS],
+            ["Pit", arr[arr['kind'] == PITCHING], PIT_STATS]]
+
+def empty_totals():
+    """
+    Return running totals for add_day_totals.  For batters and for
+    pitchers they hold the row of each player number (in the order first
+    seen), the name, team and positions (a dict used as an ordered set)
+    of each row, and an array of the summed stats.
+    """
+    return {posv: {"rows": {}, "name": [], "team": [], "pos": [],
+                   "stats": np.zeros((0, len(stats)), dtype=np.int64)}
+            for posv, stats in [["Bat", BAT_STATS], ["Pit", PIT_STATS]]}
+
+def add_day_totals(totals, arr):
+    """
+    Add the records of a day (a structured array) to running totals
+    """
+    for posv, part, stats in kind_rows(arr):
+        running = totals[posv]
+        rows = np.empty(len(part), dtype=np.int64)
+        for indx, (number, name, team, pos) in enumerate(zip(
+                part['number'].tolist(), part['name'].tolist(),
+                part['team'].tolist(), part['pos'].tolist())):
+            row = running["rows"].setdefault(number, len(running["name"]))
+            if row == len(running["name"]):
+                running["name"].append(name)
+                running["team"].append(team)
+                running["pos"].append({})
+            for single in pos.split("-"):
+                running["pos"][row][single] = True
+            rows[indx] = row
+        if len(running["name"]) > len(running["stats"]):
+            grown = np.zeros((len(running["name"]), len(stats)),
+                             dtype=np.int64)
+            grown[:len(running["stats"])] = running["stats"]
+            running["stats"] = grown
+        np.add.at(running["stats"], rows,
+                  np.column_stack([part[stat] for stat in stats]))
+
+def totals_frames(totals):
+    """
+    Return the range_totals DataFrames for running totals
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+    retv = {}
+    for posv, stats in [["Bat", BAT_STATS], ["Pit", PIT_STATS]]:
+        running = totals[posv]
+        frame = pd.DataFrame(running["stats"], columns=stats,
+                             index=pd.Index(list(running["rows"]),
+                                            dtype=object, name='number'))
+        for field, values in [["pos", ["-".join(pos)
+                                       for pos in running["pos"]]],
+                              ["team", running["team"]],
+                              ["name", running["name"]]]:
+            frame.insert(0, field, np.array(values, dtype=object))
+        retv[posv] = frame
+    return retv
@@ -0,0 +1,223 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Generated stand-ins for the cbssports pages the scrapers read: the team
+page, a day's scoreboard and its box scores.
+
+The pages hold made up players but have the markup the parsers look for
+(the team links, the score cards with their box score links, the line
+score, the four player tables and the gametracker steal rows in the
+hitters' sections), padded out to about the size of the real pages.
+The benchmark uses them when no recorded fixture file is given, so the
+fetch, parse, format and day stages can always run.  The same date and
+seed always produce the same pages.
+"""
+import random
+from web_pages import cbs_url
+from update_player_stats_for_day import box_url, STEAL_CLASS
+
+FIXTURE_DATE = "20220915"
+FIXTURE_SEED = 2022
+AL_TEAMS = {"BAL": "baltimore-orioles", "BOS": "boston-red-sox",
+            "CHW": "chicago-white-sox", "CLE": "cleveland-guardians",
+            "DET": "detroit-tigers", "HOU": "houston-astros",
+            "KC": "kansas-city-royals", "LAA": "los-angeles-angels",
+            "MIN": "minnesota-twins", "NYY": "new-york-yankees",
+            "OAK": "oakland-athletics", "SEA": "seattle-mariners",
+            "TB": "tampa-bay-rays", "TEX": "texas-rangers",
+            "TOR": "toronto-blue-jays"}
+NL_TEAMS = {"ARI": "arizona-diamondbacks", "ATL": "atlanta-braves",
+            "CHC": "chicago-cubs", "CIN": "cincinnati-reds",
+            "COL": "colorado-rockies", "LAD": "los-angeles-dodgers",
+            "MIA": "miami-marlins", "MIL": "milwaukee-brewers",
+            "NYM": "new-york-mets", "PHI": "philadelphia-phillies",
+            "PIT": "pittsburgh-pirates", "SD": "san-diego-padres",
+            "SF": "san-francisco-giants", "STL": "st-louis-cardinals",
+            "WAS": "washington-nationals"}
+FIRST_NAMES = ["A.", "B.", "C.", "D.", "E.", "J.", "L.", "M.", "R.", "T."]
+LAST_NAMES = ["Alvarez", "Baker", "Castillo", "Díaz", "Evans", "García",
+              "Hernández", "Jones", "Kim", "López", "Martin", "Núñez",
+              "Ortiz", "Pérez", "Reyes", "Smith", "Taylor", "Williams"]
+FIELD_POSITIONS = ["C", "1B", "2B", "3B", "SS", "LF", "CF", "RF", "DH"]
+FILLER_LINKS = 400
+
+def filler(rand):
+    """
+    Return navigation markup to bring a page up to the size of a real one
+    """
+    links = "".join(f'<li><a href="/mlb/news/story-{rand.randint(1, 99999)}/"'
+                    f'>Story {count}</a></li>'
+                    for count in range(FILLER_LINKS))
+    return (f'<div class="site-nav"><ul>{links}</ul></div>'
+            '<script>window.dataLayer = window.dataLayer || [];</script>')
+
+def page(rand, body):
+    """
+    Return a full html page around body
+    """
+    return (f"<!DOCTYPE html><html><head><title>MLB</title></head><body>"
+            f"{filler(rand)}{body}{filler(rand)}</body></html>")
+
+def team_page(rand):
+    """
+    Return the /mlb/teams/ page: a table of AL team links, then NL
+    """
+    tables = ""
+    for teams in [AL_TEAMS, NL_TEAMS]:
+        rows = "".join(f'<tr><td><a href="/mlb/teams/{abbr}/{slug}/">'
+                       f'{slug.replace("-", " ").title()}</a></td></tr>'
+                       for abbr, slug in teams.items())
+        tables += f"<table><tbody>{rows}</tbody></table>"
+    return page(rand, tables)
+
+def day_games(rand, gdate):
+    """
+    Return the box score paths of the games played on gdate: every team
+    plays once, and one pair of AL teams plays a second game
+    """
+    teams = list(AL_TEAMS) + list(NL_TEAMS)
+    rand.shuffle(teams)
+    games = [f"/mlb/gametracker/boxscore/MLB_{gdate}_{teams[indx]}@"
+             f"{teams[indx + 1]}/" for indx in range(0, len(teams), 2)]
+    vis, home = rand.sample(list(AL_TEAMS), 2)
+    games.append(f"/mlb/gametracker/boxscore/MLB_{gdate}_{vis}@{home}_2/")
+    return games
+
+def scoreboard_page(rand, games):
+    """
+    Return a scoreboard page with a Final score card for each game
+    """
+    cards = ""
+    for game in games:
+        teams = game.split("_", 2)[2].strip("/").split("@")
+        cards += (f'<div class="single-score-card"><div class="game-status">'
+                  f'Final</div><table><tr><td>{teams[0]}</td>'
+                  f'<td>{rand.randint(0, 9)}</td></tr><tr>'
+                  f'<td>{teams[1].split("_")[0]}</td>'
+                  f'<td>{rand.randint(0, 9)}</td></tr></table>'
+                  f'<a href="{game}">Box Score</a>'
+                  f'<a href="{game.replace("boxscore", "recap")}">'
+                  'Recap</a></div>')
+    return page(rand, cards)
+
+def player(rand, team, number):
+    """
+    Return a made up player (names are drawn from a small pool, so the
+    same name can turn up on both teams of a game)
+    """
+    name = f"{rand.choice(FIRST_NAMES)} {rand.choice(LAST_NAMES)}"
+    return {"number": str(number), "name": name, "team": team,
+            "slug": name.lower().replace(". ", "-")}
+
+def player_link(plyr):
+    """
+    Return the player page link of plyr
+    """
+    return (f'<a href="/mlb/players/{plyr["number"]}/{plyr["slug"]}/">'
+            f'{plyr["name"]}</a>')
+
+def hitter_table(rand, batters):
+    """
+    Return the hitters table of a team
+    """
+    rows = ("<tr><th>HITTERS</th><th>#</th><th>POS</th><th>AB</th>"
+            "<th>R</th><th>H</th><th>RBI</th><th>HR</th></tr>")
+    for plyr in batters:
+        atbats = rand.randint(2, 5)
+        hits = rand.randint(0, atbats)
+        homers = rand.randint(0, min(hits, 1))
+        rows += (f'<tr><td>{player_link(plyr)}</td>'
+                 f'<td>{rand.randint(1, 99)}</td><td>{plyr["pos"]}</td>'
+                 f'<td>{atbats}</td><td>{rand.randint(0, 2)}</td>'
+                 f'<td>{hits}</td><td>{rand.randint(0, 3)}</td>'
+                 f'<td>{homers if homers else "-"}</td></tr>')
+    return f"<table>{rows}</table>"
+
+def pitcher_table(rand, pitchers, decisions):
+    """
+    Return the pitchers table of a team.  decisions holds the decision
+    ("W", "L", "S" or None) of each pitcher.
+    """
+    rows = ("<tr><th>PITCHERS</th><th>IP</th><th>H</th><th>R</th>"
+            "<th>ER</th><th>BB</th><th>K</th></tr>")
+    for plyr, decision in zip(pitchers, decisions):
+        cells = f"<td>{player_link(plyr)}</td>"
+        if decision:
+            cells += (f'<td>{rand.randint(1, 99)}</td><td>({decision}, '
+                      f'{rand.randint(0, 15)}-{rand.randint(0, 15)})</td>')
+        earned = rand.randint(0, 4)
+        cells += "".join(f"<td>{value}</td>" for value in [
+            f"{rand.randint(0, 6)}.{rand.randint(0, 2)}", rand.randint(0, 8),
+            earned + rand.randint(0, 1), earned, rand.randint(0, 4),
+            rand.randint(0, 9)])
+        rows += f"<tr>{cells}</tr>"
+    return f"<table>{rows}</table>"
+
+def steal_text(rand, batters):
+    """
+    Return the text of an SB row crediting some of batters
+    """
+    parts = []
+    for plyr in rand.sample(batters, rand.randint(1, 2)):
+        steals = rand.choice([1, 1, 2])
+        parts.append(f"{plyr['name']}{f' {steals}' if steals > 1 else ''} "
+                     f"({rand.randint(1, 30)}, 2nd base off P. Pitcher/"
+                     f"C. Catcher)")
+    return ", ".join(parts)
+
+def box_page(rand, game, first_number):
+    """
+    Return the box score page of game (a path from the scoreboard), its
+    players numbered from first_number
+    """
+    teams = game.split("_", 2)[2].strip("/").split("@")
+    number = first_number
+    lineups = []
+    staffs = []
+    for team in [teams[0], teams[1].split("_")[0]]:
+        batters = []
+        for pos in FIELD_POSITIONS:
+            batters.append({**player(rand, team, number), "pos": pos})
+            number += 1
+        lineups.append(batters)
+        staffs.append([player(rand, team, number + count)
+                       for count in range(3)])
+        number += 3
+    line_score = ("<table><tr><th></th><th>R</th><th>H</th><th>E</th></tr>" +
+                  "".join(f'<tr><td>{rand.randint(0, 9)}</td>'
+                          f'<td class="logo">-</td><td>{team}</td>'
+                          f'<td>{rand.randint(0, 12)}</td></tr>'
+                          for team in teams) + "</table>")
+    notes = ('<table><tr><td>2B: P. Player (12)</td></tr><tr><td>Team LOB: '
+             f'{rand.randint(2, 12)}</td></tr></table>')
+    body = line_score
+    for batters in lineups:
+        body += hitter_table(rand, batters) + notes
+        if rand.random() < 0.6:
+            body += (f'<div class="gametracker-row">'
+                     f'<span class="{STEAL_CLASS}">SB</span>'
+                     f'<span class="{STEAL_CLASS}">'
+                     f'{steal_text(rand, batters)}</span></div>')
+    body += (pitcher_table(rand, staffs[0], ["W", None, "S"]) + notes +
+             pitcher_table(rand, staffs[1], ["L", None, None]))
+    return page(rand, body)
+
+def make_fixtures(gdate=FIXTURE_DATE, seed=FIXTURE_SEED):
+    """
+    Return generated pages for gdate in the form benchmark.read_fixtures
+    returns recorded ones: the date, the urls of the box scores with an AL
+    team (in scoreboard order) and the pages indexed by url
+    """
+    rand = random.Random(seed)
+    games = day_games(rand, gdate)
+    pages = {cbs_url("/mlb/teams/"): team_page(rand),
+             cbs_url(f"/mlb/scoreboard/{gdate}"): scoreboard_page(rand,
+                                                                  games)}
+    boxes = []
+    for count, game in enumerate(games):
+        pages[box_url(game)] = box_page(rand, game, 100000 + 100 * count)
+        teams = game.split("_", 2)[2].strip("/").split("@")
+        if teams[0] in AL_TEAMS or teams[1].split("_")[0] in AL_TEAMS:
+            boxes.append(box_url(game))
+    return {"date": gdate, "boxes": boxes, "pages": pages}
@@ -6,9 +6,10 @@ Produce a set of tables of stats for free agent players
 """
 import os
 from datetime import datetime, timedelta
-from operator import itemgetter
 import json
-import pandas as pd
+from season_store import range_frames, windows_frames
+from roster_index import get_roster_index
+from run_stats import stage
 
 MAGIC_BHITS = 7
 MAGIC_BABS = 30
@@ -33,37 +34,48 @@ FUNC_TABLE = [[False, False, False, False,
                ]]
 TITLES = [['HOME RUNS', 'STOLEN BASES', 'RBIS', 'RUNS', 'AVERAGE'],
           ['WINS', 'SAVES', 'ERA', 'WHIP', 'Ks/9']]
+TABLE_LENGTH = 20
+STAT_LABELS = {"Bat": ['AB', 'R', 'H', 'RBI', 'HR', 'SB'],
+               "Pit": ['W', 'S', 'outs', 'H', 'ER', 'BB', 'KS']}
+SORT_ORDER = [[['HR', True], ['SB', True], ['RBI', True], ['R', True],
+               ['aavg', True]],
+              [['W', True], ['S', True], ['aera', False], ['awhip', False],
+               ['aks9', True]]]
 
 def get_taken_players():
     """
-    Return a list of players that are on roto teams (read from league.json)
+    Return the set of players that are on roto teams (read from
+    league.json through the cached roster index)
     """
-    taken_list = []
-    pfile = os.sep.join(["..", "data", "league.json"])
-    with open(pfile, "r", encoding="utf8") as fdesc:
-        data = json.load(fdesc)
-    for team in data['rosters']:
-        for player in data['rosters'][team]:
-            taken_list.append(player['number'])
-    return taken_list
+    return get_roster_index()["taken"]
 
 def add_stats(accum, posv, entry):
     """
     Accumulate stats for a player (passed in entry).  Posv is either "Bat"
-    or "Pit"
+    or "Pit".  The accumulated record is a new dict (entry itself is never
+    kept or changed).  While accumulating, a batter's 'pos' is the set of
+    positions played (a dict, in the order first played), a record's 'pos'
+    such as "PH-SS" adding each of its positions.
     """
-    slabels = {"Bat": ['AB', 'R', 'H', 'RBI', 'HR', 'SB'],
-               "Pit": ['W', 'S', 'outs', 'H', 'ER', 'BB', 'KS']}
-    for stat in slabels[posv]:
-        accum[posv][entry["number"]][stat] += entry[stat]
+    if entry["number"] not in accum[posv]:
+        player = {"number": entry["number"], "name": entry["name"],
+                  "team": entry["team"],
+                  "pos": {} if posv == "Bat" else entry["pos"]}
+        player.update(dict.fromkeys(STAT_LABELS[posv], 0))
+        accum[posv][entry["number"]] = player
+    player = accum[posv][entry["number"]]
+    for stat in STAT_LABELS[posv]:
+        player[stat] += entry[stat]
     if posv == "Bat":
-        accum[posv][entry["number"]]['pos'] += "-" + entry['pos']
-    return accum[posv][entry["number"]]
+        for pos in entry['pos'].split("-"):
+            player['pos'][pos] = True
+    return player
 
 def get_stats_on_date(accum, in_date):
     """
     Give a date specified, collect stats on that date and add those to
-    the accum parameter.  Return that new accum value.
+    the accum parameter.  Return that new accum value.  Batter 'pos'
+    values are position sets until get_stats_in_range joins them.
     """
     sfile = os.sep.join(["..", "data", f"rot{in_date}.json"])
     if not os.path.exists(sfile):
@@ -76,15 +88,15 @@ def get_stats_on_date(accum, in_date):
             posv = "Pit"
             if 'AB' in entry:
                 continue
-        if entry["number"] in accum[posv]:
-            accum[posv][entry["number"]] = add_stats(accum, posv, entry)
-        else:
-            accum[posv][entry["number"]] = entry
+        add_stats(accum, posv, entry)
     return accum
 
 def get_stats_in_range(start_date, end_date):
     """
-    Get stats for all players with the range specified.
+    Get stats for all players with the range specified, reading the day
+    files one at a time (the reference the season store is checked
+    against).  A batter's 'pos' lists each position played once, joined
+    with "-".
     """
     dval = datetime.strptime(start_date, "%Y%m%d")
     enddate = datetime.strptime(end_date, "%Y%m%d")
@@ -94,6 +106,8 @@ def get_stats_in_range(start_date, end_date):
     while dval != enddate:
         all_stats = get_stats_on_date(all_stats, dval.strftime("%Y%m%d"))
         dval += timedelta(1)
+    for batter in all_stats["Bat"].values():
+        batter['pos'] = "-".join(batter['pos'])
     return all_stats, date_diff
 
 def get_available(all_stats):
@@ -147,7 +161,8 @@ def get_pit_list(pdata, day_range):
 def collect_stats_free_agents(from_date, to_date):
     """
     Return a list of batter stats and a list of pitcher stats for the
-    date range specified (inclusive)
+    date range specified (inclusive).  This is the dict based reference
+    for collect_frames_free_agents, reading the day files themselves.
     """
     astats, day_range = get_stats_in_range(from_date, to_date)
     avail = get_available(astats)
@@ -155,32 +170,44 @@ def collect_stats_free_agents(from_date, to_date):
     pit_list = get_pit_list(avail['Pit'], day_range.days)
     return bat_list, pit_list
 
-def sort_fields(data, fields):
+def add_adjusted_stats(frames, day_range):
     """
-    Return a structure indexd by stat name.  Each element of that structure
-    is a list of player records sorted by the stat key value.
-
-    fields is a list of lists containing the stat name, and an indicator
-    if stats should be sorted in ascending or descending order.
+    Vectorized version of get_bat_list and get_pit_list.  frames is a dict
+    of "Bat" and "Pit" DataFrames of counting stats (one row per player)
+    and day_range the number of days they cover.  Return new frames with
+    the aavg, aera, awhip and aks9 columns added.
     """
-    retv = {}
-    for info in fields:
-        retv[info[0]] = sorted(data, key=itemgetter(info[0]),
-                               reverse=info[1])
-    return retv
+    bat = frames["Bat"]
+    bat = bat.assign(aavg=(day_range * MAGIC_BHITS + bat['H']) /
+                          (day_range * MAGIC_BABS + bat['AB']))
+    pit = frames["Pit"]
+    denominator = day_range * MAGIC_OUTS + pit['outs']
+    pit = pit.assign(
+        aera=OUTS_PER_GAME * ((day_range * MAGIC_ER + pit['ER']) /
+                              denominator),
+        awhip=OUTS_PER_INNING * ((day_range * MAGIC_WHIP + pit['BB'] +
+                                  pit['H']) / denominator),
+        aks9=OUTS_PER_GAME * ((day_range * MAGIC_KCOUNT + pit['KS']) /
+                              denominator))
+    return {"Bat": bat, "Pit": pit}
 
-def get_sorted_tables(data):
+def collect_frames_free_agents(from_date, to_date):
     """
-    Call sort_fields for all batter and pitcher stats
+    Return a dict of "Bat" and "Pit" DataFrames (indexed by player
+    number) of free agent stats for the date range specified (inclusive),
+    computed from two season store snapshots.
     """
-    batter_tables = sort_fields(data[0], [['HR', True], ['SB', True],
-                                          ['RBI', True], ['R', True],
-                                          ['aavg', True]])
-    pitcher_tables = sort_fields(data[1], [['W', True], ['S', True],
-                                          ['aera', False], ['awhip', False],
-                                          ['aks9', True]])
-    return batter_tables, pitcher_tables
+    totals, day_range = range_frames(from_date, to_date)
+    return free_agent_frames(totals, day_range, get_taken_players())
 
+def free_agent_frames(totals, day_range, taken):
+    """
+    Return the collect_frames_free_agents frames for a range_frames result,
+    leaving out the players in taken
+    """
+    frames = {posv: frame[~frame.index.isin(taken)]
+              for posv, frame in totals.items()}
+    return add_adjusted_stats(frames, day_range.days)
 
 def limit_list(frame, stat, func=None):
     """
@@ -191,6 +218,32 @@ def limit_list(frame, stat, func=None):
         return frame[frame[stat] > 0]
     return frame[func(frame[stat])]
 
+def top_rows(frame, stat, descending, count=TABLE_LENGTH):
+    """
+    Return the count best rows of frame for stat, best first, with ties
+    kept in frame order (the same rows as a stable sort followed by
+    head(count)).  np.argpartition finds the count-th best value without
+    sorting the column; only the rows at least that good are then sorted.
+    A column holding NaN values is sorted the old way.
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    values = frame[stat].to_numpy()
+    if len(values) <= count or (values.dtype.kind == "f" and
+                                np.isnan(values).any()):
+        return frame.sort_values(stat, ascending=not descending,
+                                 kind="stable").head(count)
+    key = -values if descending else values
+    threshold = key[np.argpartition(key, count - 1)[count - 1]]
+    rows = np.flatnonzero(key <= threshold)
+    return frame.iloc[rows[np.argsort(key[rows], kind="stable")][:count]]
+
+def leaderboard(frame, stat, descending, func=None, count=TABLE_LENGTH):
+    """
+    Return the top_rows of frame for stat after limit_list filtering
+    """
+    return top_rows(limit_list(frame, stat, func=func), stat, descending,
+                    count)
+
 def report_free_agents_in_range(from_d, to_d):
     """
     from_d and to_d are date fields in "yyyymmdd" format.
@@ -200,21 +253,44 @@ def report_free_agents_in_range(from_d, to_d):
 
     Generate a set of tables for each scoring stat in html format.
     """
-    data1 = collect_stats_free_agents(from_d, to_d)
-    tables = get_sorted_tables(data1)
-    out_data = ""
-    for ptype in range(0, 2):
-        for count, stat_name in enumerate(DISP_TABLES[ptype]):
-            tframe = pd.DataFrame(tables[ptype][stat_name])
-            dframe = tframe[COLUMNS[ptype]]
-            sframe = limit_list(dframe, stat_name,
-                                func=FUNC_TABLE[ptype][count])
-            out_data += f"<br><br><h1>{TITLES[ptype][count]}</h1>"
-            out_data += sframe.head(20).to_html(index=False)
+    report_free_agents_in_windows([(from_d, to_d)])
+
+def report_free_agents_in_windows(windows):
+    """
+    Write the report_free_agents_in_range tables for every (from_d, to_d)
+    window in windows.  Each window is the difference of two season store
+    snapshots, and the roster index is looked up once for all of them.
+    """
+    with stage("report"):
+        taken = get_taken_players()
+        for (from_d, to_d), (totals, day_range) in zip(
+                windows, windows_frames(windows)):
+            write_report(from_d, to_d,
+                         free_agent_frames(totals, day_range, taken))
+
+def write_report(from_d, to_d, frames):
+    """
+    Write the tables for the free agent frames of a date range to
+    stats_from_{from_d}_to_{to_d}.html
+    """
     html_file_name = f"stats_from_{from_d}_to_{to_d}.html"
     fname = os.sep.join(["..", "data", html_file_name])
     with open(fname, "w", encoding="utf8") as data_out:
-        data_out.write(out_data)
+        data_out.write(report_html(frames))
+
+def report_html(frames):
+    """
+    Return the html tables (one per scoring stat) for free agent frames
+    """
+    out_data = ""
+    for ptype, posv in enumerate(["Bat", "Pit"]):
+        for count, stat_name in enumerate(DISP_TABLES[ptype]):
+            sframe = leaderboard(frames[posv], stat_name,
+                                 SORT_ORDER[ptype][count][1],
+                                 func=FUNC_TABLE[ptype][count])
+            out_data += f"<br><br><h1>{TITLES[ptype][count]}</h1>"
+            out_data += sframe[COLUMNS[ptype]].to_html(index=False)
+    return out_data
 
 if __name__ == "__main__":
     report_free_agents_in_range("20220914", "20220920")
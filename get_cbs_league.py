@@ -10,10 +10,16 @@ The results are savedin data/league.json
 """
 import os
 import json
+import time
 import configparser
-from bs4 import BeautifulSoup
-import pandas as pd
-from selenium_login import selenium_login
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from web_pages import RATE_LIMITER, REQUEST_TIMEOUT
+from run_stats import stage, record_request
+
+ROSTER_WORKERS = 6
+PLAYER_ID_FILE = os.sep.join(["..", "data", "player_ids.json"])
+PLAYER_ID_TTL = 30 * 24 * 60 * 60
 
 class BadPlayerNumber(Exception):
     """
@@ -32,6 +38,7 @@ def get_cbs_team_numbers(webdrvr, league_id):
     Returns: List of tuples. Each tuple consists of a team number and
              a rotisserie team name.
     """
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
     webdrvr.get(f"https://{league_id}/standings/overall")
     soup = BeautifulSoup(webdrvr.page_source, "html.parser")
     tables = soup.find_all("table")
@@ -49,6 +56,7 @@ def get_my_cbs_team_id(webdrvr, league_id):
     Return:
        A team number.
     """
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
     webdrvr.get(f"https://{league_id}")
     soup = BeautifulSoup(webdrvr.page_source, "html.parser")
     href_tags = soup.find_all(href=True)
@@ -103,7 +111,21 @@ def get_cbs_rosters(webdrvr, league_id, team_num):
     """
     team_pg = f"https://{league_id}/teams/{team_num}"
     webdrvr.get(team_pg)
-    soup = BeautifulSoup(webdrvr.page_source, "html.parser")
+    return parse_cbs_roster(webdrvr.page_source)
+
+def parse_cbs_roster(page_source):
+    """
+    Extract the roster from the html of a team page
+
+    Input:
+       page_source: Team page html
+
+    Returns:
+       Roster expressed as a dictionary
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    soup = BeautifulSoup(page_source, "html.parser")
     plist = soup.findAll(
         lambda tag:tag.name == "a" and tag.has_attr('aria-label') and
         tag.has_attr('href') and tag.has_attr("class")
@@ -112,12 +134,93 @@ def get_cbs_rosters(webdrvr, league_id, team_num):
         plyr['href'] for plyr in plist if plyr['class'][0] == 'playerLink'
     ]
     plinks = list(dict.fromkeys(rplist))
-    pdinfo = pd.read_html(webdrvr.page_source)
+    pdinfo = pd.read_html(page_source)
     linfo = iter(plinks)
     roster = extract_cbs_info(linfo, pdinfo[0])
     roster += extract_cbs_info(linfo, pdinfo[1])
     return roster
 
+def session_from_driver(webdrvr):
+    """
+    Return a requests Session that carries the cookies (and user agent)
+    of the logged in Selenium driver
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+    session = requests.Session()
+    session.headers["User-Agent"] = webdrvr.execute_script(
+        "return navigator.userAgent")
+    for cookie in webdrvr.get_cookies():
+        session.cookies.set(cookie["name"], cookie["value"],
+                            domain=cookie.get("domain"),
+                            path=cookie.get("path", "/"))
+    return session
+
+def timed_session_get(session, url):
+    """
+    Request url with a logged in session (after waiting for the rate
+    limiter) and record the request in the run statistics
+    """
+    RATE_LIMITER.wait(url)
+    start = time.perf_counter()
+    resp = session.get(url, timeout=REQUEST_TIMEOUT)
+    record_request(url, len(resp.content), time.perf_counter() - start,
+                   resp.status_code)
+    return resp
+
+def fetch_cbs_roster(session, league_id, team_num):
+    """
+    Get a team roster with a plain http request using a logged in session
+
+    Input:
+       session: requests Session (see session_from_driver)
+       league_id: League website id
+       team_num: Team number
+
+    Returns:
+       Roster expressed as a dictionary, or None if the request failed or
+       the page returned did not contain a roster
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+    try:
+        resp = timed_session_get(session,
+                                 f"https://{league_id}/teams/{team_num}")
+        return parse_cbs_roster(resp.text)
+    except (requests.RequestException, ValueError, IndexError,
+            StopIteration):
+        return None
+
+def get_all_cbs_rosters(webdrvr, league_id, teams, workers=ROSTER_WORKERS):
+    """
+    Get the rosters of all teams.
+
+    With more than one worker, the team pages are fetched at the same time
+    over http using the driver's login cookies.  Any team whose page could
+    not be read that way (and every team when workers is 1) is read with
+    the Selenium driver instead.
+
+    Input:
+       webdrvr: Selenium driver
+       league_id: League website id
+       teams: List of (team number, team name) tuples
+       workers: Number of pages fetched at the same time
+
+    Returns:
+       Dictionary of rosters indexed by team number
+    """
+    team_nums = [entry[0] for entry in teams]
+    results = [None] * len(team_nums)
+    if workers > 1:
+        session = session_from_driver(webdrvr)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                partial(fetch_cbs_roster, session, league_id), team_nums))
+    rosters = {}
+    for team_num, roster in zip(team_nums, results):
+        if roster is None:
+            roster = get_cbs_rosters(webdrvr, league_id, team_num)
+        rosters[team_num] = roster
+    return rosters
+
 def check_cbs_player_number(webdrvr, league_id, number):
     """
     Given a player number, return a name
@@ -132,46 +235,122 @@ def check_cbs_player_number(webdrvr, league_id, number):
     """
     ppg1 = f"https://{league_id}/players/playerpage/{number}"
     webdrvr.get(ppg1)
-    soup = BeautifulSoup(webdrvr.page_source, "html.parser")
+    return parse_player_name(webdrvr.page_source)
+
+def parse_player_name(page_source):
+    """
+    Return the player name (og:title) found in the html of a player page
+    """
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    soup = BeautifulSoup(page_source, "html.parser")
     glist = soup.findAll(
         lambda tag:tag.name == "meta" and tag.has_attr('property') and
         tag.has_attr('content')
     )
     return [x['content'] for x in glist if x['property'] == 'og:title'][0]
 
-def get_cbs_league(extracheck=False):
+def fetch_cbs_player_name(session, league_id, number):
+    """
+    Given a player number, return a name using a plain http request with
+    a logged in session.  Returns None if the request failed or the page
+    had no name on it.
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+    try:
+        resp = timed_session_get(
+            session, f"https://{league_id}/players/playerpage/{number}")
+        return parse_player_name(resp.text)
+    except (requests.RequestException, IndexError):
+        return None
+
+def read_player_ids():
+    """
+    Return the player identity cache: a dictionary indexed by player
+    number of the name found on the player page and the time it was
+    checked
+    """
+    if not os.path.exists(PLAYER_ID_FILE):
+        return {}
+    with open(PLAYER_ID_FILE, "r", encoding="utf8") as infile:
+        return json.load(infile)
+
+def verify_player_numbers(webdrvr, league_id, rosters,
+                          workers=ROSTER_WORKERS):
+    """
+    Make sure that every rostered player number corresponds to the player
+    named on the roster.
+
+    Players whose number and name already match an entry of the player
+    identity cache checked within PLAYER_ID_TTL seconds are not checked
+    again.  The rest are checked concurrently over http (falling back to
+    the Selenium driver for pages that could not be read that way), and
+    the results are saved in the cache.
+
+    Raises:
+        BadPlayerNumber if a number belongs to some other player
+    """
+    player_ids = read_player_ids()
+    now = time.time()
+    to_check = {}
+    for roster in rosters.values():
+        for player in roster:
+            known = player_ids.get(player['number'])
+            if (known and known['name'] == player['name'] and
+                    now - known['checked'] < PLAYER_ID_TTL):
+                continue
+            print(player)
+            to_check[player['number']] = player
+    numbers = list(to_check)
+    names = [None] * len(numbers)
+    if workers > 1 and numbers:
+        session = session_from_driver(webdrvr)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            names = list(executor.map(
+                partial(fetch_cbs_player_name, session, league_id), numbers))
+    bad_numbers = []
+    for number, tname in zip(numbers, names):
+        if tname is None:
+            tname = check_cbs_player_number(webdrvr, league_id, number)
+        player_ids[number] = {"name": tname, "checked": now}
+        if to_check[number]['name'] != tname:
+            bad_numbers.append(number)
+    with open(PLAYER_ID_FILE, "w", encoding="utf8") as outfile:
+        json.dump(player_ids, outfile)
+    if bad_numbers:
+        raise BadPlayerNumber(", ".join(bad_numbers))
+
+def get_cbs_league(extracheck=False, workers=ROSTER_WORKERS):
     """
     Extract league information
 
     Input parammeter:
         extracheck: If true, make sure every number used corresponds to
         a real player.
+        workers: Number of team (and player) pages read at the same time
+        (see get_all_cbs_rosters)
     Results:
         Creation of data/league.json file containing roster data
     """
+    # pylint: disable-next=import-outside-toplevel
+    from selenium_login import selenium_login
     secret_info = configparser.ConfigParser()
     in_dir = os.sep.join(["..", "config"])
     secret_info.read(os.sep.join([in_dir, "secret.ini"]))
     league_id = secret_info["DEFAULT"]["leagueid"]
     out_path = os.sep.join(["..", "data", "league.json"])
-    driver = selenium_login(in_dir)
-    my_team_id = get_my_cbs_team_id(driver, league_id)
-    teams = get_cbs_team_numbers(driver, league_id)
-    rosters = {}
-    for entry in teams:
-        rosters[entry[0]] = get_cbs_rosters(driver, league_id, entry[0])
+    with stage("login"):
+        driver = selenium_login(in_dir)
+    with stage("rosters"):
+        my_team_id = get_my_cbs_team_id(driver, league_id)
+        teams = get_cbs_team_numbers(driver, league_id)
+        rosters = get_all_cbs_rosters(driver, league_id, teams, workers)
     league = {"my_team": my_team_id, "standings": teams,
               "rosters": rosters}
     with open(out_path, "w", encoding="utf8") as outfile:
         json.dump(league, outfile)
     if extracheck:
-        for irosters in rosters.items():
-            for player in irosters[1]:
-                print(player)
-                tname = check_cbs_player_number(driver, league_id,
-                                                player['number'])
-                if player['name'] != tname:
-                    raise BadPlayerNumber
+        with stage("verify_players"):
+            verify_player_numbers(driver, league_id, rosters, workers)
 
 if __name__ == "__main__":
     get_cbs_league()
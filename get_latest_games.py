@@ -5,17 +5,27 @@
 Game extraction code. Does not require logging in.
 """
 import os
+import re
+import json
+import time
+import threading
 from datetime import datetime, timedelta
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+from web_pages import get_page, cbs_url
+from run_stats import stage, cache_result
+
+def day_file_path(gdate):
+    """
+    Return the path of the rot{gdate}.json file holding a day's stats
+    """
+    return os.sep.join(["..", "data", f"rot{gdate}.json"])
 
 def get_al_team_data():
     """
     Return a dictionary of real team names indexed by abbreviation
     """
-    resp = requests.get("https://www.cbssports.com/mlb/teams/")
-    soup = BeautifulSoup(resp.text, "html.parser")
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    page = get_page(cbs_url("/mlb/teams/"))
+    soup = BeautifulSoup(page, "html.parser")
     tables = soup.findAll('table')
     refss = []
     for atag in tables[0].find_all("a", href=True):
@@ -27,48 +37,116 @@ def get_al_team_data():
         retv[parts[0]] = teamname
     return retv
 
+TEAM_DATA_TTL = 7 * 24 * 60 * 60
+TEAM_DATA_FILE = os.sep.join(["..", "data", "al_teams.json"])
+TEAM_DIRECTORY = {}
+TEAM_DIRECTORY_LOCK = threading.Lock()
+
+def read_team_file(ttl):
+    """
+    Return the team directory saved in TEAM_DATA_FILE, or None if that
+    file does not exist or is more than ttl seconds old.
+    """
+    if not os.path.exists(TEAM_DATA_FILE):
+        return None
+    with open(TEAM_DATA_FILE, "r", encoding="utf8") as fdesc:
+        data = json.load(fdesc)
+    if time.time() - data["saved"] > ttl:
+        return None
+    return data["teams"]
+
+def get_team_directory(save=True, ttl=TEAM_DATA_TTL):
+    """
+    Return the get_al_team_data() dictionary, fetching it at most once per
+    process.
+
+    Input:
+        save -- If true, also keep the directory in TEAM_DATA_FILE so that
+                later runs can reuse it
+        ttl -- Age in seconds after which the saved directory is refetched
+    Returns:
+        dictionary of real team names indexed by abbreviation
+    """
+    with TEAM_DIRECTORY_LOCK:
+        if "teams" not in TEAM_DIRECTORY:
+            teams = None
+            if save:
+                teams = read_team_file(ttl)
+            cache_result("team_directory", teams is not None)
+            if teams is None:
+                teams = get_al_team_data()
+                if save:
+                    with open(TEAM_DATA_FILE, "w",
+                              encoding="utf8") as fdesc:
+                        json.dump({"saved": time.time(), "teams": teams},
+                                  fdesc)
+            TEAM_DIRECTORY["teams"] = teams
+        return TEAM_DIRECTORY["teams"]
+
+LAST_FULL_DAY_FILE = os.sep.join(["..", "data", "last_full_day.json"])
+TABLE_HEADER = re.compile(r"<th[^>]*>(.*?)</th>", re.IGNORECASE | re.DOTALL)
+MARKUP_TAG = re.compile(r"<[^>]*>")
+GAME_FINAL = re.compile(r"\bFinal\b")
+
 def is_okay_stat_day(stat_d):
     """
     Given a date (yyyymmdd format) return true if that day has results
     and all games are complete
 
+    Only the table header cells of the schedule page are looked at.  A
+    "Result" column means games have finished, a "Home Starter" column
+    means some games have not been played yet.
+
     Input:
         stat_d -- date in yyyymmdd format
     Returns:
         True if this day has all completed results
     """
-    resp = requests.get(f"https://www.cbssports.com/mlb/schedule/{stat_d}/")
-    pdinfo = pd.read_html(resp.text)
-    result = False
-    all_done = True
-    for ptable in pdinfo:
-        pyval = ptable.to_dict()
-        if "Result" in pyval:
-            result = True
-        if "Home Starter" in pyval:
-            all_done = False
-    return result and all_done
+    with stage("schedule"):
+        page = get_page(cbs_url(f"/mlb/schedule/{stat_d}/"))
+        headers = {MARKUP_TAG.sub("", hdr).strip()
+                   for hdr in TABLE_HEADER.findall(page)}
+    return "Result" in headers and "Home Starter" not in headers
+
+def read_last_full_day():
+    """
+    Return the last complete date saved by get_last_full_day (yyyymmdd
+    format), or an empty string if none has been saved.
+    """
+    if not os.path.exists(LAST_FULL_DAY_FILE):
+        return ""
+    with open(LAST_FULL_DAY_FILE, "r", encoding="utf8") as fdesc:
+        return json.load(fdesc)["date"]
 
 def get_last_full_day():
     """
     Find most recent date for which is_okay_stat_day is true.
 
+    A completed day stays complete, so the answer is saved in
+    LAST_FULL_DAY_FILE and the backward search stops as soon as it reaches
+    that date without checking it again.
+
     Returns:
         date in yyyymmdd format
     """
+    known_day = read_last_full_day()
     dvalue = datetime.today()
     sdvalue = dvalue.strftime('%Y%m%d')
-    while not is_okay_stat_day(sdvalue):
+    while sdvalue > known_day and not is_okay_stat_day(sdvalue):
         dvalue -= timedelta(1)
         sdvalue = dvalue.strftime('%Y%m%d')
+    if sdvalue > known_day:
+        with open(LAST_FULL_DAY_FILE, "w", encoding="utf8") as fdesc:
+            json.dump({"date": sdvalue}, fdesc)
     return sdvalue
 
-def get_recent_games(datev=None):
+def get_recent_games(datev=None, force=False):
     """
     Find games played on the most recent complete date.
 
     Params:
         datev -- Date to start searching from.  If not specified, use today.
+        force -- If true, list the games even if rot{date}.json exists
     Returns:
         list of boxscore urls
     """
@@ -76,25 +154,64 @@ def get_recent_games(datev=None):
         gdate = datev
     else:
         gdate = get_last_full_day()
-    out_path = os.sep.join(["..", "data", f"rot{gdate}.json"])
-    if os.path.exists(out_path):
+    if os.path.exists(day_file_path(gdate)) and not force:
         print(f"Skipping -- rot{gdate}.json already exists")
         return []
-    resp = requests.get(f"https://www.cbssports.com/mlb/scoreboard/{gdate}")
-    soup = BeautifulSoup(resp.text, "html.parser")
-    result = soup.find_all("a", href=True)
-    boxlist = []
-    for entry in result:
-        if entry['href'].find("boxscore/MLB_") > 0:
-            boxlist.append(entry['href'])
-    return boxlist
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    with stage("scoreboard"):
+        page = get_page(cbs_url(f"/mlb/scoreboard/{gdate}"))
+        soup = BeautifulSoup(page, "html.parser")
+        result = box_score_links(soup)
+    return [entry['href'] for entry in result]
+
+def box_score_links(soup):
+    """
+    Return the box score links (a tags) found in a scoreboard page
+    """
+    return [entry for entry in soup.find_all("a", href=True)
+            if entry['href'].find("boxscore/MLB_") > 0]
+
+def game_card_text(link):
+    """
+    Return the text of the largest element around a box score link that
+    does not also hold another game's box score link (the game's score
+    card on the scoreboard)
+    """
+    card = link
+    while card.parent is not None:
+        hrefs = {entry['href'] for entry in box_score_links(card.parent)}
+        if hrefs != {link['href']}:
+            break
+        card = card.parent
+    return card.get_text(" ")
+
+def get_game_states(gdate):
+    """
+    Read the scoreboard for gdate and return whether each game is over.
+
+    Returns:
+        dict indexed by boxscore url (in scoreboard order) that is True
+        for games whose score card says Final
+    """
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    with stage("scoreboard"):
+        page = get_page(cbs_url(f"/mlb/scoreboard/{gdate}"))
+        soup = BeautifulSoup(page, "html.parser")
+        states = {}
+        for link in box_score_links(soup):
+            if link['href'] not in states:
+                states[link['href']] = bool(
+                    GAME_FINAL.search(game_card_text(link)))
+    return states
 
-def filter_al_teams_from_boxscores(list_of_box_scores):
+def filter_al_teams_from_boxscores(list_of_box_scores, team_data=None):
     """
     Given a list of boxscores, return a list of those boxscores where at
-    least one AL team played.
+    least one AL team played.  team_data defaults to the cached
+    get_team_directory() result.
     """
-    team_data = get_al_team_data()
+    if team_data is None:
+        team_data = get_team_directory()
     outlist = []
     for game in list_of_box_scores:
         parts = game.split("@")
@@ -106,12 +223,13 @@ def filter_al_teams_from_boxscores(list_of_box_scores):
             outlist.append(game)
     return outlist
 
-def get_latest_games(datev=None):
+def get_latest_games(datev=None, team_data=None):
     """
     Return a list of boxscores to check.  datev is a date in yyyymmdd
     format.  If not specified, search from today.
     """
-    return filter_al_teams_from_boxscores(get_recent_games(datev))
+    return filter_al_teams_from_boxscores(get_recent_games(datev),
+                                          team_data)
 
 if __name__ == "__main__":
     print(get_latest_games())
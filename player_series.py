@@ -0,0 +1,221 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Per-player daily time series, for streak and trend queries.
+
+The index holds, for batters and for pitchers, an array of running totals
+indexed by player (position in the index's list of numbers), date ordinal
+(days since the first day file) and stat.  The totals for any window of
+days are then one subtraction, for every player at once, so rolling sums
+and recent-versus-prior comparisons never reread the day files.
+
+An index covers one season (the day files of one year), so its size
+depends on the length of a season rather than of the whole data
+directory.  It is built from the day files (through their columnar
+copies) and kept in memory until a day file of its season is added or
+rewritten.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from day_columns import load_dated_columns, HITTING, PITCHING
+from day_columns import BAT_STATS, PIT_STATS, list_dates, DATA_DIR
+from free_agent_report import add_adjusted_stats, get_taken_players, top_rows
+from free_agent_report import DISP_TABLES, SORT_ORDER, TITLES
+
+SERIES_STATS = {"Bat": BAT_STATS + ['G'], "Pit": PIT_STATS + ['G']}
+SERIES_INDEX = {}
+SERIES_INDEX_LOCK = threading.Lock()
+
+def day_files_version(start_date="", end_date="99999999"):
+    """
+    Return a value that changes whenever a day file (dated from start_date
+    to end_date, all of them by default) is added or rewritten
+    """
+    dates = [sdate for sdate in list_dates(DATA_DIR, "rot")
+             if start_date <= sdate <= end_date]
+    latest = max((os.stat(os.sep.join([DATA_DIR, f"rot{sdate}.json"]))
+                  .st_mtime_ns for sdate in dates), default=0)
+    return (len(dates), dates[0] if dates else "",
+            dates[-1] if dates else "", latest)
+
+def date_ordinals(days, start):
+    """
+    Convert an array of yyyymmdd integers to days since start
+    """
+    first = datetime.strptime(start, "%Y%m%d")
+    unique_days = np.unique(days)
+    ordinals = np.array([(datetime.strptime(str(day), "%Y%m%d") - first).days
+                         for day in unique_days], dtype=np.int64)
+    return ordinals[np.searchsorted(unique_days, days)]
+
+def series_part(arr, ordinals, stats, ndays):
+    """
+    Build the running totals of one kind of player (batters or pitchers)
+    from their records.  The last stat, 'G', counts games.
+    """
+    numbers, player = np.unique(arr['number'], return_inverse=True)
+    daily = np.zeros((len(numbers), ndays + 1, len(stats)), dtype=np.int32)
+    values = np.column_stack([arr[stat] for stat in stats[:-1]] +
+                             [np.ones(len(arr), dtype=np.int32)])
+    np.add.at(daily, (player, ordinals + 1), values)
+    latest = np.zeros(len(numbers), dtype=np.int64)
+    np.maximum.at(latest, player, np.arange(len(arr)))
+    return {"numbers": numbers, "names": arr['name'][latest],
+            "teams": arr['team'][latest],
+            "totals": daily.cumsum(axis=1, dtype=np.int32)}
+
+def latest_season():
+    """
+    Return the season (yyyy) of the latest day file, or the current year
+    if there are none
+    """
+    dates = list_dates(DATA_DIR, "rot")
+    return dates[-1][:4] if dates else datetime.today().strftime("%Y")
+
+def build_series_index(season):
+    """
+    Build the time series index from the day files of season (yyyy)
+    """
+    dates = [sdate for sdate in list_dates(DATA_DIR, "rot")
+             if sdate.startswith(season)]
+    if not dates:
+        return {"start": "", "days": 0, "Bat": None, "Pit": None}
+    arr, days, date_diff = load_dated_columns(dates[0], dates[-1])
+    ordinals = date_ordinals(days, dates[0])
+    index = {"start": dates[0], "days": date_diff.days}
+    for posv, rows in [["Bat", (arr['kind'] == HITTING) & (arr['pos'] != 'P')],
+                       ["Pit", arr['kind'] == PITCHING]]:
+        index[posv] = series_part(arr[rows], ordinals[rows],
+                                  SERIES_STATS[posv], date_diff.days)
+    return index
+
+def get_series_index(season=None):
+    """
+    Return the time series index of season (yyyy, the latest season by
+    default), rebuilding it if the day files of that season changed
+    """
+    season = season or latest_season()
+    version = day_files_version(f"{season}0101", f"{season}1231")
+    with SERIES_INDEX_LOCK:
+        if SERIES_INDEX.get(season, {}).get("version") != version:
+            SERIES_INDEX[season] = build_series_index(season)
+            SERIES_INDEX[season]["version"] = version
+        return SERIES_INDEX[season]
+
+def date_ordinal(index, sdate):
+    """
+    Return the ordinal of sdate (yyyymmdd format) in index, clipped to the
+    dates covered
+    """
+    ordinal = (datetime.strptime(sdate, "%Y%m%d") -
+               datetime.strptime(index["start"], "%Y%m%d")).days
+    return min(max(ordinal, 0), index["days"])
+
+def window_totals(posv, start_date, end_date, index=None):
+    """
+    Return a DataFrame, indexed by player number, of the name, team and
+    summed stats (including games, 'G') of every batter or pitcher (posv
+    is "Bat" or "Pit") for the days from start_date to end_date
+    (inclusive).  Players who did not play in the window have zeros.
+    The index defaults to the one of end_date's season.
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+    index = index or get_series_index(end_date[:4])
+    part = index[posv]
+    if part is None:
+        return pd.DataFrame(columns=['name', 'team'] + SERIES_STATS[posv])
+    first = date_ordinal(index, start_date)
+    last = date_ordinal(index, (datetime.strptime(end_date, "%Y%m%d") +
+                                timedelta(1)).strftime("%Y%m%d"))
+    sums = part["totals"][:, last] - part["totals"][:, first]
+    frame = pd.DataFrame(sums.astype(np.int64), columns=SERIES_STATS[posv],
+                         index=pd.Index(part["numbers"], name='number'))
+    frame.insert(0, 'team', part["teams"])
+    frame.insert(0, 'name', part["names"])
+    return frame
+
+def rolling(posv, stat, days, index=None):
+    """
+    Return a DataFrame, indexed by player number with one column per date
+    (yyyymmdd), of each player's stat summed over the days days ending on
+    that date, for the dates of the index (the latest season by default)
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+    index = index or get_series_index()
+    part = index[posv]
+    totals = part["totals"][:, :, SERIES_STATS[posv].index(stat)]
+    ends = np.arange(1, index["days"] + 1)
+    sums = totals[:, ends] - totals[:, np.maximum(ends - days, 0)]
+    start = datetime.strptime(index["start"], "%Y%m%d")
+    columns = [(start + timedelta(int(day))).strftime("%Y%m%d")
+               for day in range(index["days"])]
+    return pd.DataFrame(sums, columns=columns,
+                        index=pd.Index(part["numbers"], name='number'))
+
+def trend(end_date, recent=5, prior=20, index=None):
+    """
+    Compare the last recent days up to end_date with the prior days before
+    them.  Counting stats are compared per day and the adjusted stats of
+    free_agent_report (aavg, aera, awhip, aks9) directly.
+
+    Returns: dict of "Bat" and "Pit" DataFrames holding name, team and,
+             for each DISP_TABLES stat, the recent and prior values and
+             the change, for the players who played in the recent days
+    """
+    index = index or get_series_index(end_date[:4])
+    end = datetime.strptime(end_date, "%Y%m%d")
+    split = end - timedelta(recent)
+    windows = {}
+    for label, first, last, days in [
+            ["recent", split + timedelta(1), end, recent],
+            ["prior", split - timedelta(prior - 1), split, prior]]:
+        frames = {posv: window_totals(posv, first.strftime("%Y%m%d"),
+                                      last.strftime("%Y%m%d"), index)
+                  for posv in ["Bat", "Pit"]}
+        windows[label] = (add_adjusted_stats(frames, days), days)
+    retv = {}
+    for ptype, posv in enumerate(["Bat", "Pit"]):
+        recent_frame = windows["recent"][0][posv]
+        prior_frame = windows["prior"][0][posv]
+        frame = recent_frame[['name', 'team']].copy()
+        for stat in DISP_TABLES[ptype]:
+            new = recent_frame[stat]
+            old = prior_frame[stat]
+            if not stat.startswith('a'):
+                new = new / windows["recent"][1]
+                old = old / windows["prior"][1]
+            frame[f"{stat} recent"] = new
+            frame[f"{stat} prior"] = old
+            frame[f"{stat} change"] = new - old
+        retv[posv] = frame[recent_frame['G'] > 0]
+    return retv
+
+def report_hot_free_agents(end_date, recent=5, prior=20):
+    """
+    Write tables of the free agents whose performance changed the most
+    (best first) in the last recent days up to end_date compared with
+    the prior days, for each scoring stat, to
+    hot_{end_date}_{recent}_vs_{prior}.html
+    """
+    frames = trend(end_date, recent, prior)
+    taken = get_taken_players()
+    out_data = ""
+    for ptype, posv in enumerate(["Bat", "Pit"]):
+        frame = frames[posv][~frames[posv].index.isin(taken)]
+        for count, stat in enumerate(DISP_TABLES[ptype]):
+            change = f"{stat} change"
+            leaders = top_rows(frame, change, SORT_ORDER[ptype][count][1])
+            out_data += f"<br><br><h1>{TITLES[ptype][count]}</h1>"
+            out_data += leaders[['name', 'team', f"{stat} recent",
+                                 f"{stat} prior", change]].to_html(
+                                     index=False)
+    fname = os.sep.join([DATA_DIR,
+                         f"hot_{end_date}_{recent}_vs_{prior}.html"])
+    with open(fname, "w", encoding="utf8") as data_out:
+        data_out.write(out_data)
+
+if __name__ == "__main__":
+    report_hot_free_agents(datetime.today().strftime("%Y%m%d"))
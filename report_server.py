@@ -0,0 +1,109 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Local http server for free agent reports.
+
+GET /?from=yyyymmdd&to=yyyymmdd returns the report_free_agents_in_range
+tables for that range.  Reports are kept in an LRU cache keyed by the
+range, the league.json version and the version of the day files in the
+range, so a repeated query is answered from memory until a roster change
+or a new (or rewritten) day file makes a new report necessary.
+
+Usage: python report_server.py [port [host]]
+"""
+import sys
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from free_agent_report import collect_frames_free_agents, report_html
+from roster_index import league_version
+from player_series import day_files_version
+
+REPORT_HOST = "127.0.0.1"
+REPORT_PORT = 8080
+REPORT_CACHE_SIZE = 64
+REPORT_PATHS = ["/", "/report"]
+
+@lru_cache(maxsize=REPORT_CACHE_SIZE)
+def cached_report(from_d, to_d, roster_version, days_version):
+    """
+    Return the report page for a range.  roster_version and days_version
+    are only part of the cache key.
+    """
+    # pylint: disable=unused-argument
+    tables = report_html(collect_frames_free_agents(from_d, to_d))
+    return (f"<html><head><title>Free agents {from_d} to {to_d}</title>"
+            f"</head><body>{tables}</body></html>")
+
+def get_report(from_d, to_d):
+    """
+    Return the report page for the range from_d to to_d (yyyymmdd format,
+    inclusive), from the cache if nothing it depends on has changed
+    """
+    return cached_report(from_d, to_d, league_version(),
+                         day_files_version(from_d, to_d))
+
+def valid_date(sdate):
+    """
+    Return True if sdate is a date in yyyymmdd format
+    """
+    try:
+        return datetime.strptime(sdate, "%Y%m%d").strftime("%Y%m%d") == sdate
+    except ValueError:
+        return False
+
+class ReportHandler(BaseHTTPRequestHandler):
+    """
+    Answer report requests
+    """
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Send the report for the from and to query parameters
+        """
+        url = urlparse(self.path)
+        if url.path not in REPORT_PATHS:
+            self.send_text(404, "Not found")
+            return
+        query = parse_qs(url.query)
+        from_d = query.get("from", [""])[0]
+        to_d = query.get("to", [""])[0]
+        if not (valid_date(from_d) and valid_date(to_d) and from_d <= to_d):
+            self.send_text(400, "Usage: /?from=yyyymmdd&to=yyyymmdd")
+            return
+        try:
+            page = get_report(from_d, to_d)
+        except Exception as exc:  # pylint: disable=broad-except
+            self.log_error("Report %s to %s failed: %r", from_d, to_d, exc)
+            self.send_text(500, f"Report failed: {exc}")
+            return
+        self.send_text(200, page, "text/html")
+
+    def send_text(self, status, text, content_type="text/plain"):
+        """
+        Send a response holding text
+        """
+        body = text.encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve_reports(port=REPORT_PORT, host=REPORT_HOST):
+    """
+    Serve reports until interrupted
+    """
+    server = ThreadingHTTPServer((host, port), ReportHandler)
+    print(f"Serving free agent reports on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    serve_reports(int(sys.argv[1]) if len(sys.argv) > 1 else REPORT_PORT,
+                  sys.argv[2] if len(sys.argv) > 2 else REPORT_HOST)
@@ -0,0 +1,53 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Index of the players on roto team rosters (read from league.json).
+
+The index is built once and kept in memory.  It is only rebuilt when
+league.json changes (different modification time or size).
+"""
+import os
+import json
+import threading
+
+LEAGUE_FILE = os.sep.join(["..", "data", "league.json"])
+ROSTER_INDEX = {}
+ROSTER_INDEX_LOCK = threading.Lock()
+
+def league_version():
+    """
+    Return a value that changes whenever league.json is rewritten
+    """
+    fstat = os.stat(LEAGUE_FILE)
+    return (fstat.st_mtime_ns, fstat.st_size)
+
+def get_roster_index():
+    """
+    Return the roster index, rebuilding it if league.json has changed.
+
+    Returns: dictionary containing
+        version -- league_version() of the league.json file indexed
+        taken -- frozenset of the numbers of all rostered players
+        owner -- dictionary of roto team numbers indexed by player number
+    """
+    version = league_version()
+    with ROSTER_INDEX_LOCK:
+        if ROSTER_INDEX.get("version") != version:
+            with open(LEAGUE_FILE, "r", encoding="utf8") as fdesc:
+                data = json.load(fdesc)
+            owner = {}
+            for team in data['rosters']:
+                for player in data['rosters'][team]:
+                    owner[player['number']] = team
+            ROSTER_INDEX.update({"version": version,
+                                 "taken": frozenset(owner),
+                                 "owner": owner})
+        return ROSTER_INDEX
+
+def get_owner(number):
+    """
+    Return the roto team number that player number is on (None for a
+    free agent)
+    """
+    return get_roster_index()["owner"].get(number)
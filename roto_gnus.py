@@ -2,38 +2,76 @@
 # Copyright (c) 2022 Warren Usui
 # This code is licensed under the MIT license (see LICENSE.txt for details)
 """
-One stop routine for the last seven days.
+One stop routine for the last seven days.  Free agent reports are written
+for the last 7, 14 and 30 days and for the season to date.
+
+Each run writes a summary of where its time went (see run_stats) to
+data/run_summary.json.
 """
+import sys
 from datetime import datetime, timedelta
 from get_cbs_league import get_cbs_league
-from get_latest_games import get_latest_games
 from update_player_stats_for_day import update_latest_games
-from free_agent_report import report_free_agents_in_range
+from free_agent_report import report_free_agents_in_windows
+from day_columns import list_dates, DATA_DIR
+from web_pages import evict_pages
+from run_stats import reset_run_stats, set_profile_stage, stage
+from run_stats import write_run_summary
+
+REPORT_DAYS = [7, 14, 30]
 
 def update_a_range(start_date, end_date):
     """
-    Call get_latest_games and update_latest_games for days in the range
-    specified
+    Call update_latest_games for days in the range specified.  Days whose
+    rot{date}.json file already exists are skipped without any fetching.
     """
     dval = datetime.strptime(start_date, "%Y%m%d")
     enddate = datetime.strptime(end_date, "%Y%m%d")
     while dval != enddate:
         str_date = datetime.strftime(dval, "%Y%m%d")
-        get_latest_games(str_date)
         update_latest_games(str_date)
         dval += timedelta(1)
 
-def roto_gnus():
+def report_windows(enddate):
     """
-    Do all the calculations for the last seven day period
+    Return the (start, end) date ranges reported on: the last REPORT_DAYS
+    days up to enddate, and the season to date (starting at the first day
+    file of enddate's year)
     """
-    get_cbs_league()
-    enddate = datetime.today()
-    startdate = enddate - timedelta(7)
-    startvalue = startdate.strftime('%Y%m%d')
     endvalue = enddate.strftime('%Y%m%d')
-    update_a_range(startvalue, endvalue)
-    report_free_agents_in_range(startvalue, endvalue)
+    windows = [((enddate - timedelta(days)).strftime('%Y%m%d'), endvalue)
+               for days in REPORT_DAYS]
+    season = [sdate for sdate in list_dates(DATA_DIR, "rot")
+              if sdate[0:4] == endvalue[0:4] and sdate <= endvalue]
+    if season:
+        windows.append((season[0], endvalue))
+    return windows
+
+def roto_gnus(profile_stage=None):
+    """
+    Do all the calculations for the last seven day period
+
+    Input:
+        profile_stage -- Name of a stage (for example "parse" or "report")
+                         to run under cProfile
+    """
+    reset_run_stats()
+    set_profile_stage(profile_stage)
+    try:
+        with stage("total"):
+            with stage("league"):
+                get_cbs_league()
+            enddate = datetime.today()
+            startdate = enddate - timedelta(7)
+            startvalue = startdate.strftime('%Y%m%d')
+            endvalue = enddate.strftime('%Y%m%d')
+            with stage("games"):
+                update_a_range(startvalue, endvalue)
+            with stage("evict_pages"):
+                evict_pages()
+            report_free_agents_in_windows(report_windows(enddate))
+    finally:
+        write_run_summary()
 
 if __name__ == "__main__":
-    roto_gnus()
+    roto_gnus(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,160 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Run instrumentation.
+
+Every module records what it does here: time spent in named stages, http
+requests (count, bytes and latency, grouped by the kind of page
+requested), cache hits and misses, and plain counters such as the number
+of records parsed.  write_run_summary() saves all of it as JSON at the
+end of a run.
+
+Stage times are added up over every call, so a stage run by several
+threads at once can total more seconds than the run took.  One stage can
+also be profiled with cProfile (see set_profile_stage).
+"""
+import os
+import json
+import time
+import cProfile
+import threading
+import contextlib
+from datetime import datetime
+
+RUN_SUMMARY_FILE = os.sep.join(["..", "data", "run_summary.json"])
+PROFILE_DIR = os.sep.join(["..", "data"])
+URL_CLASSES = [["/mlb/teams/", "teams"], ["/mlb/scoreboard/", "scoreboard"],
+               ["/mlb/schedule/", "schedule"], ["/boxscore/", "box_score"],
+               ["/teams/", "roster"], ["/players/playerpage/", "player"]]
+RATE_SOURCES = {"records_per_second": ["records", "parse"]}
+RUN_STATS = {"started": time.time(), "stages": {}, "http": {}, "cache": {},
+             "counters": {}}
+RUN_STATS_LOCK = threading.Lock()
+PROFILE_SETTINGS = {"stage": None, "profiler": None, "active": False}
+
+def reset_run_stats():
+    """
+    Forget everything recorded so far (call at the start of a run)
+    """
+    with RUN_STATS_LOCK:
+        RUN_STATS.update({"started": time.time(), "stages": {}, "http": {},
+                          "cache": {}, "counters": {}})
+
+def set_profile_stage(stage):
+    """
+    Profile the calls of the stage named (None turns profiling off).  All
+    of the calls are collected by one profiler, and write_run_summary()
+    saves its statistics to profile_{stage}.prof in PROFILE_DIR, for use
+    with pstats or snakeviz.
+
+    A profiler can only be running once at a time, so while one thread is
+    in the stage, calls of it made by other threads (the parse stage runs
+    in every box score worker, for instance) are timed but not profiled.
+    The profile then covers a sample of the calls rather than all of them.
+    """
+    with RUN_STATS_LOCK:
+        PROFILE_SETTINGS.update({
+            "stage": stage, "active": False,
+            "profiler": cProfile.Profile() if stage else None})
+
+def url_class(url):
+    """
+    Return the kind of page url is, for grouping http statistics
+    """
+    for pattern, name in URL_CLASSES:
+        if pattern in url:
+            return name
+    return "other"
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Time the enclosed code as part of the stage named (and profile it, see
+    set_profile_stage)
+    """
+    profiler = None
+    if PROFILE_SETTINGS["stage"] == name:
+        with RUN_STATS_LOCK:
+            if not PROFILE_SETTINGS["active"]:
+                PROFILE_SETTINGS["active"] = True
+                profiler = PROFILE_SETTINGS["profiler"]
+    if profiler:
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler:
+            profiler.disable()
+        with RUN_STATS_LOCK:
+            if profiler:
+                PROFILE_SETTINGS["active"] = False
+            entry = RUN_STATS["stages"].setdefault(name, {"seconds": 0.0,
+                                                         "calls": 0})
+            entry["seconds"] += elapsed
+            entry["calls"] += 1
+
+def count(name, amount=1):
+    """
+    Add amount to the counter named
+    """
+    with RUN_STATS_LOCK:
+        RUN_STATS["counters"][name] = (RUN_STATS["counters"].get(name, 0) +
+                                       amount)
+
+def cache_result(name, hit):
+    """
+    Record a hit (hit is true) or a miss of the cache named
+    """
+    with RUN_STATS_LOCK:
+        entry = RUN_STATS["cache"].setdefault(name, {"hits": 0,
+                                                     "misses": 0})
+        entry["hits" if hit else "misses"] += 1
+
+def record_request(url, nbytes, seconds, status):
+    """
+    Record an http request for url that returned nbytes of content with
+    the status code given, seconds after it was sent
+    """
+    with RUN_STATS_LOCK:
+        entry = RUN_STATS["http"].setdefault(url_class(url), {
+            "requests": 0, "bytes": 0, "seconds": 0.0, "status": {}})
+        entry["requests"] += 1
+        entry["bytes"] += nbytes
+        entry["seconds"] += seconds
+        entry["status"][str(status)] = entry["status"].get(str(status),
+                                                           0) + 1
+
+def run_summary():
+    """
+    Return everything recorded as a dictionary, with cache hit rates,
+    average request latencies and the rates listed in RATE_SOURCES
+    (a counter divided by the time of a stage) filled in
+    """
+    with RUN_STATS_LOCK:
+        summary = json.loads(json.dumps(RUN_STATS))
+    summary["started"] = datetime.fromtimestamp(
+        summary["started"]).isoformat(timespec="seconds")
+    for entry in summary["cache"].values():
+        entry["hit_rate"] = entry["hits"] / (entry["hits"] + entry["misses"])
+    for entry in summary["http"].values():
+        entry["average_latency"] = entry["seconds"] / entry["requests"]
+    summary["rates"] = {}
+    for rate, [counter, stage_name] in RATE_SOURCES.items():
+        seconds = summary["stages"].get(stage_name, {}).get("seconds")
+        if seconds and counter in summary["counters"]:
+            summary["rates"][rate] = summary["counters"][counter] / seconds
+    return summary
+
+def write_run_summary(out_file=RUN_SUMMARY_FILE):
+    """
+    Save run_summary() as JSON in out_file, and the statistics of the
+    stage profiled (if any) in PROFILE_DIR
+    """
+    with open(out_file, "w", encoding="utf8") as fdesc:
+        json.dump(run_summary(), fdesc, indent=2)
+    if PROFILE_SETTINGS["profiler"]:
+        PROFILE_SETTINGS["profiler"].dump_stats(os.sep.join(
+            [PROFILE_DIR, f"profile_{PROFILE_SETTINGS['stage']}.prof"]))
@@ -0,0 +1,211 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Cumulative season stats store.
+
+For every day file rot{date}.json there is a snapshot cum{date}.json in
+data/cumulative holding each player's running totals up to and including
+that date.  The stats for any range of dates are then the difference of
+two snapshots, so range reports never have to reread the day files.
+"""
+import os
+import copy
+import json
+import bisect
+import threading
+from functools import lru_cache
+from datetime import datetime, timedelta
+import numpy as np
+from day_columns import list_dates, DATA_DIR
+from run_stats import stage
+
+STORE_DIR = os.sep.join(["..", "data", "cumulative"])
+STORE_LOCK = threading.RLock()
+STAT_LABELS = {"Bat": ['AB', 'R', 'H', 'RBI', 'HR', 'SB'],
+               "Pit": ['W', 'S', 'outs', 'H', 'ER', 'BB', 'KS']}
+
+def snapshot_path(sdate):
+    """
+    Return the path of the snapshot file for sdate (yyyymmdd format)
+    """
+    return os.sep.join([STORE_DIR, f"cum{sdate}.json"])
+
+def load_snapshot(sdate):
+    """
+    Return the snapshot saved for sdate.  The result is shared between
+    callers and must not be modified.
+    """
+    return read_snapshot(sdate, os.stat(snapshot_path(sdate)).st_mtime_ns)
+
+@lru_cache(maxsize=32)
+def read_snapshot(sdate, mtime):
+    """
+    Read the snapshot for sdate for load_snapshot.  mtime is only part of
+    the cache key, so that a snapshot rewritten by another process (the
+    daily update, while report_server is running) is read again.
+    """
+    # pylint: disable=unused-argument
+    with open(snapshot_path(sdate), "r", encoding="utf8") as fdesc:
+        return json.load(fdesc)
+
+def snapshot_on_or_before(sdate):
+    """
+    Return the latest snapshot taken on or before sdate (an empty set of
+    totals if there is none)
+    """
+    dates = list_dates(STORE_DIR, "cum")
+    indx = bisect.bisect_right(dates, sdate)
+    if indx == 0:
+        return {"Bat": {}, "Pit": {}}
+    return load_snapshot(dates[indx - 1])
+
+def add_day(totals, day_stats):
+    """
+    Add the records of a day file to totals (modified in place).  Records
+    are split into batters and pitchers the same way get_stats_on_date
+    does.  Each player also gets a game count ('G') and batters get a
+    count of games played at each position (a record's 'pos' can list
+    several, such as "PH-SS").
+    """
+    for entry in day_stats:
+        posv = "Bat"
+        if entry["pos"] == "P":
+            posv = "Pit"
+            if 'AB' in entry:
+                continue
+        if entry["number"] not in totals[posv]:
+            totals[posv][entry["number"]] = dict.fromkeys(
+                STAT_LABELS[posv] + ['G'], 0)
+            if posv == "Bat":
+                totals[posv][entry["number"]]['positions'] = {}
+        player = totals[posv][entry["number"]]
+        player['name'] = entry['name']
+        player['team'] = entry['team']
+        player['G'] += 1
+        for stat in STAT_LABELS[posv]:
+            player[stat] += entry[stat]
+        if posv == "Bat":
+            for pos in entry['pos'].split("-"):
+                player['positions'][pos] = (
+                    player['positions'].get(pos, 0) + 1)
+    return totals
+
+def rebuild_season_store(from_date=""):
+    """
+    Recompute the snapshots for every day file dated from_date or later,
+    chaining from the snapshot before from_date.  With no from_date the
+    whole store is rebuilt.
+    """
+    with STORE_LOCK, stage("season_store"):
+        build_snapshots(from_date)
+
+def build_snapshots(from_date):
+    """
+    Write the snapshots for rebuild_season_store
+    """
+    os.makedirs(STORE_DIR, exist_ok=True)
+    prev_day = ""
+    if from_date:
+        prev_day = (datetime.strptime(from_date, "%Y%m%d") -
+                    timedelta(1)).strftime("%Y%m%d")
+    totals = copy.deepcopy(snapshot_on_or_before(prev_day))
+    for sdate in list_dates(STORE_DIR, "cum"):
+        if sdate >= from_date:
+            os.remove(snapshot_path(sdate))
+    for sdate in list_dates(DATA_DIR, "rot"):
+        if sdate < from_date:
+            continue
+        with open(os.sep.join([DATA_DIR, f"rot{sdate}.json"]), "r",
+                  encoding="utf8") as fdesc:
+            totals = add_day(totals, json.load(fdesc))
+        tmp_path = (f"{snapshot_path(sdate)}.{os.getpid()}."
+                    f"{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf8") as fdesc:
+            json.dump(totals, fdesc)
+        os.replace(tmp_path, snapshot_path(sdate))
+
+def update_season_store(gdate):
+    """
+    Bring the store up to date after rot{gdate}.json was written.  Day
+    files added out of order cause the later snapshots to be recomputed.
+    """
+    rebuild_season_store(min([gdate] + missing_snapshot_dates()))
+
+def missing_snapshot_dates():
+    """
+    Return the dates of day files that have no snapshot yet
+    """
+    have = set(list_dates(STORE_DIR, "cum"))
+    return [sdate for sdate in list_dates(DATA_DIR, "rot")
+            if sdate not in have]
+
+def get_range_stats(start_date, end_date):
+    """
+    Return the same (stats, date_diff) pair as
+    free_agent_report.get_stats_in_range, computed from two snapshots.
+    Players who did not play in the range are left out.  A player's name
+    and team are the latest ones seen up to end_date, and players are
+    listed in the order they first appeared in the store (which decides
+    the order of tied players in the report tables).
+    """
+    dval = datetime.strptime(start_date, "%Y%m%d")
+    enddate = datetime.strptime(end_date, "%Y%m%d") + timedelta(1)
+    with STORE_LOCK:
+        missing = missing_snapshot_dates()
+        if missing:
+            rebuild_season_store(missing[0])
+        before = snapshot_on_or_before(
+            (dval - timedelta(1)).strftime("%Y%m%d"))
+        after = snapshot_on_or_before(end_date)
+    all_stats = {"Bat": {}, "Pit": {}}
+    for posv in ["Bat", "Pit"]:
+        for number, player in after[posv].items():
+            old = before[posv].get(number)
+            if old and old['G'] == player['G']:
+                continue
+            entry = {"number": number, "name": player['name'],
+                     "team": player['team']}
+            for stat in STAT_LABELS[posv]:
+                entry[stat] = player[stat] - (old[stat] if old else 0)
+            if posv == "Bat":
+                old_pos = old['positions'] if old else {}
+                entry['pos'] = "-".join(
+                    pos for pos, count in player['positions'].items()
+                    if count > old_pos.get(pos, 0))
+            else:
+                entry['pos'] = 'P'
+            all_stats[posv][number] = entry
+    return all_stats, enddate - dval
+
+def range_frames(start_date, end_date):
+    """
+    Return get_range_stats as the range_totals of day_columns does: a dict
+    of "Bat" and "Pit" DataFrames indexed by player number holding name,
+    team, pos and the summed counting stats, and the timedelta spanned.
+    The sums are the same as range_totals gives.  Players are listed in
+    the order they first appeared in the store rather than in the range,
+    and name and team are the latest ones rather than the first.
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+    all_stats, date_diff = get_range_stats(start_date, end_date)
+    frames = {}
+    for posv, stats in all_stats.items():
+        frame = pd.DataFrame(
+            [[entry[stat] for stat in STAT_LABELS[posv]]
+             for entry in stats.values()],
+            columns=STAT_LABELS[posv], dtype=np.int64,
+            index=pd.Index(list(stats), dtype=object, name='number'))
+        for field in ['pos', 'team', 'name']:
+            frame.insert(0, field, np.array(
+                [entry[field] for entry in stats.values()], dtype=object))
+        frames[posv] = frame
+    return frames, date_diff
+
+def windows_frames(windows):
+    """
+    Return the range_frames results for every (start_date, end_date)
+    window in windows
+    """
+    return [range_frames(start_date, end_date)
+            for start_date, end_date in windows]
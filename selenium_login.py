@@ -3,15 +3,97 @@
 # This code is licensed under the MIT license (see LICENSE.txt for details)
 """
 Selenium webpage login utility
+
+The cookies of a successful login and the path of the chrome driver are
+saved in session.json in the configuration directory.  Later logins reuse
+them as long as the saved cookies are still accepted by the site.
 """
 import os
+import json
 import configparser
 import yaml
+import requests
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from webdriver_manager.chrome import ChromeDriverManager
+from run_stats import cache_result
+
+SESSION_FILE = "session.json"
+
+def read_session(in_dir):
+    """
+    Return the saved session information (an empty dict if none)
+    """
+    spath = os.sep.join([in_dir, SESSION_FILE])
+    if not os.path.exists(spath):
+        return {}
+    with open(spath, "r", encoding="utf8") as infile:
+        return json.load(infile)
+
+def write_session(in_dir, session):
+    """
+    Save session information.  The file holds login cookies, so it is
+    only readable by its owner.
+    """
+    spath = os.sep.join([in_dir, SESSION_FILE])
+    fdesc = os.open(spath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fdesc, "w", encoding="utf8") as outfile:
+        json.dump(session, outfile)
+
+def start_driver(in_dir):
+    """
+    Start Chrome.  The driver path found by ChromeDriverManager is saved
+    and used directly on later runs; the manager is only consulted again
+    if the saved driver is missing or fails to start.
+    """
+    session = read_session(in_dir)
+    dpath = session.get("driver_path")
+    if dpath and os.path.exists(dpath):
+        try:
+            return webdriver.Chrome(service=Service(dpath))
+        except WebDriverException:
+            pass
+    session["driver_path"] = ChromeDriverManager().install()
+    write_session(in_dir, session)
+    return webdriver.Chrome(service=Service(session["driver_path"]))
+
+def cookies_are_valid(cookies, check_url):
+    """
+    Make one request to check_url with the cookies.  They are considered
+    valid if the page is returned rather than a redirect (to the login
+    page).
+    """
+    if not cookies or not check_url:
+        return False
+    jar = requests.cookies.RequestsCookieJar()
+    for cookie in cookies:
+        jar.set(cookie["name"], cookie["value"], domain=cookie.get("domain"),
+                path=cookie.get("path", "/"))
+    try:
+        resp = requests.get(check_url, cookies=jar, allow_redirects=False,
+                            timeout=10)
+    except requests.RequestException:
+        return False
+    return resp.status_code == 200
+
+def restore_cookies(driver, cookies):
+    """
+    Load saved cookies into the browser (through the Chrome devtools
+    protocol, so no page has to be loaded first)
+    """
+    cdp_cookies = []
+    for cookie in cookies:
+        cdp_cookie = {key: cookie[key] for key in
+                      ["name", "value", "domain", "path", "secure",
+                       "httpOnly", "sameSite"] if key in cookie}
+        if "expiry" in cookie:
+            cdp_cookie["expires"] = cookie["expiry"]
+        cdp_cookies.append(cdp_cookie)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setCookies", {"cookies": cdp_cookies})
 
 def selenium_login(in_dir):
     """
@@ -24,7 +106,9 @@ def selenium_login(in_dir):
         Secret.ini contain entries for you username and password
         Fields.yaml contains the url for the login site and field types
         and identifiers for the name, password, and submit button on the
-        login site.
+        login site.  An optional checkurl entry names a page that is only
+        returned to logged in users (default is the leagueid site from
+        secret.ini); it is used to check that saved cookies still work.
 
     Returns:
         Webdriver on success
@@ -33,8 +117,6 @@ def selenium_login(in_dir):
     Note that success and failure are also displayed by the behavior
     of the web browser.
     """
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()))
-
     secret_info = configparser.ConfigParser()
     secret_info.read(os.sep.join([in_dir, "secret.ini"]))
 
@@ -48,6 +130,18 @@ def selenium_login(in_dir):
         except yaml.YAMLError as exc:
             print(exc)
 
+    check_url = ydata.get("checkurl")
+    if not check_url and "leagueid" in secret_info["DEFAULT"]:
+        check_url = f"https://{secret_info['DEFAULT']['leagueid']}"
+    cookies = read_session(in_dir).get("cookies")
+    cookies_ok = cookies_are_valid(cookies, check_url)
+    cache_result("login_cookies", cookies_ok)
+
+    driver = start_driver(in_dir)
+    if cookies_ok:
+        restore_cookies(driver, cookies)
+        return driver
+
     driver.get(ydata["url"])
     driver.find_element(ydata["usertype"], ydata["uservar"]).send_keys(user)
     driver.find_element(ydata["passtype"], ydata["passvar"]).send_keys(pwrd)
@@ -61,4 +155,7 @@ def selenium_login(in_dir):
     errors = driver.find_elements(By.CLASS_NAME, "flash-error")
     if errors:
         return errors
+    session = read_session(in_dir)
+    session["cookies"] = driver.get_cookies()
+    write_session(in_dir, session)
     return driver
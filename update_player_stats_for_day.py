@@ -7,16 +7,34 @@ Does not require signing in.
 """
 import os
 import json
-import requests
-from bs4 import BeautifulSoup
-from get_latest_games import get_latest_games, get_al_team_data
+import threading
+import unicodedata
+from functools import partial
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from get_latest_games import get_team_directory, get_last_full_day
+from get_latest_games import get_recent_games, filter_al_teams_from_boxscores
+from get_latest_games import day_file_path, get_game_states
+from web_pages import get_page, cbs_url, set_offline, PageNotCached
+from season_store import update_season_store, rebuild_season_store
+from day_columns import save_day_columns, columns_path, list_dates
+from day_columns import DATA_DIR
+from run_stats import stage, count
 
-def get_players(ptype, p_data, team):
+BOX_SCORE_WORKERS = 8
+BOX_PARSER = "lxml"
+STEAL_CLASS = "gametracker-row__item"
+SECTION_SIDES = {0: None, 1: 0, 3: 1, 5: None, 7: None}
+GAME_STATE_DIR = os.sep.join(["..", "data", "games"])
+
+def get_players(ptype, p_data, team, team_data=None):
     """
     Collect stats for a player (use branches variable as a switch).
+    team_data defaults to the cached get_team_directory() result.
     """
     retv = []
-    team_data = get_al_team_data()
+    if team_data is None:
+        team_data = get_team_directory()
     if team not in team_data:
         return retv
     branches = {'HITTERS': hitting, 'PITCHERS': pitching}
@@ -82,21 +100,51 @@ def hitting(plyr, istats, offset):
     plyr['SB'] = 0
     return plyr
 
-def add_steals(sdata, ret_stats):
+def normalize_name(name):
+    """
+    Return the form of a player name used to match steals to batters
+    (accents, case and extra spaces removed)
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(name.casefold().split())
+
+def batter_index(ret_stats):
+    """
+    Index the batter records of a box score by normalized name and team.
+    Returns a dict of {team: [positions in ret_stats]} dicts.
+    """
+    index = {}
+    for indx, plyr in enumerate(ret_stats):
+        if 'AB' in plyr:
+            index.setdefault(normalize_name(plyr['name']), {}).setdefault(
+                plyr['team'], []).append(indx)
+    return index
+
+def add_steals(sdata, ret_stats, teams):
     """
-    Insert steals data into the batter records (collected independently)
+    Insert steals data into the batter records (collected independently).
+
+    sdata is the list of steal rows found by parse_steals, and teams the
+    visiting and home teams.  Batters are looked up by normalized name on
+    the team of the section a row was listed in.  For a row outside both
+    teams' sections, batters of either team with the name are credited,
+    with a warning if the name is on both teams.
     """
-    for steal in sdata:
-        chk = 0
-        for count, plyr in enumerate(ret_stats):
-            if steal == plyr['name']:
-                chk += 1
-                ret_stats[count]['SB'] = sdata[steal]
-            if chk > 1:
+    index = batter_index(ret_stats)
+    for row in sdata:
+        team = None if row["side"] is None else teams[row["side"]]
+        for steal, value in row["steals"].items():
+            matches = index.get(normalize_name(steal), {})
+            if team is None and len(matches) > 1:
                 print(f"possible steal issue with: {steal}")
+            for mteam, positions in matches.items():
+                if team is None or mteam == team:
+                    for indx in positions:
+                        ret_stats[indx]['SB'] = value
     return ret_stats
 
-def format_records(raw_data):
+def format_records(raw_data, team_data=None):
     """
     Convert the raw data scraped from box score webpages into a dict
     containing individual stats.
@@ -108,54 +156,89 @@ def format_records(raw_data):
     teams.append(raw_data['home'].split(",")[2])
     if teams[1].endswith("_2"):
         teams[1] = teams[1][0:-2]
-    for count, stats in enumerate(raw_data['tables']):
-        ret_stats.extend(get_players(player_pos[count // 2], stats,
-                         teams[count % 2]))
-    ret_stats = add_steals(raw_data["Steals"], ret_stats)
+    for indx, stats in enumerate(raw_data['tables']):
+        ret_stats.extend(get_players(player_pos[indx // 2], stats,
+                         teams[indx % 2], team_data))
+    ret_stats = add_steals(raw_data["Steals"], ret_stats, teams)
     return ret_stats
 
-def extract_steals(soup):
+def extract_steals(soup, tables):
+    """
+    Extract the steal data from the box score.  Return as list (one entry
+    per steal row) of the parse_steals rows.
+    """
+    elements = soup.findAll(lambda tag: tag.name == "table" or (
+        tag.name == "span" and STEAL_CLASS in tag.get("class", [])))
+    return parse_steals(section_spans(elements, tables,
+                                      lambda entry: entry.text))
+
+def section_spans(elements, tables, span_text):
     """
-    Extract the steal data from the box score.  Return as dict of steal
-    numbers indexed by player name.
+    Given the tables and gametracker spans of a box score in page order,
+    return the text of each span and the side (0 for the visitors, 1 for
+    the home team) of the hitters section it is in.  A section starts
+    with the team's hitters table and ends at the next player table, so
+    spans before the first hitters table or after the pitchers tables
+    get None.
+    """
+    table_nums = {id(table): tnum for tnum, table in enumerate(tables)}
+    side = None
+    retv = []
+    for entry in elements:
+        tnum = table_nums.get(id(entry))
+        if tnum is None:
+            retv.append([span_text(entry), side])
+        elif tnum in SECTION_SIDES:
+            side = SECTION_SIDES[tnum]
+    return retv
+
+def parse_steals(spans):
+    """
+    Given the [text, side] pairs of the gametracker spans of a box score
+    (from section_spans), return a dict for each SB row (each team's
+    steals are listed in a row of their own) holding the side of the row
+    and the steal numbers indexed by player name.
     """
-    spans = soup.findAll("span", {"class": "gametracker-row__item"})
     response = []
     prevsb = False
-    for entry in spans:
+    for text, side in spans:
         if prevsb:
-            response.append(entry.text)
+            response.append({"side": side, "steals": steal_row(text)})
         prevsb = False
-        if entry.text == "SB":
+        if text == "SB":
             prevsb = True
+    return response
+
+def steal_row(stl_data):
+    """
+    Return the steal numbers indexed by player name listed in the text of
+    an SB row
+    """
     steal_ret = {}
-    for stl_data in response:
-        for indv in stl_data.split(","):
-            indv = indv.strip()
-            if " (" in indv:
-                indv = indv[0:indv.find(" (")]
-            name = indv.split(" ")
-            value = 1
-            if name[-1].isnumeric():
-                value = int(name[-1])
-                name = name[0:-1]
-            nname = " ".join(name)
-            if nname.startswith("- "):
-                nname = nname[2:]
-            if nname not in steal_ret:
-                steal_ret[nname] = value
+    for indv in stl_data.split(","):
+        indv = indv.strip()
+        if " (" in indv:
+            indv = indv[0:indv.find(" (")]
+        name = indv.split(" ")
+        value = 1
+        if name[-1].isnumeric():
+            value = int(name[-1])
+            name = name[0:-1]
+        nname = " ".join(name)
+        if nname.startswith("- "):
+            nname = nname[2:]
+        if nname not in steal_ret:
+            steal_ret[nname] = value
     return steal_ret
 
-def get_box_data(box_id):
+def soup_box_data(soup):
     """
-    Given a game id, extract the player info as a dict containing
-    the stats
+    Extract the raw box score data (steals, line score rows and the four
+    player tables) from a BeautifulSoup tree
     """
-    resp = requests.get(f"https://www.cbssports.com/{box_id}")
-    soup = BeautifulSoup(resp.text, "html.parser")
     raw_box_data = {}
-    raw_box_data['Steals'] = extract_steals(soup)
     tables = soup.findAll("table")
+    raw_box_data['Steals'] = extract_steals(soup, tables)
     frows = tables[0].find_all("tr")
     raw_box_data['visitors'] = frows[1].get_text(separator=',')
     raw_box_data['home'] = frows[2].get_text(separator=',')
@@ -171,28 +254,270 @@ def get_box_data(box_id):
             player = [pdata.get_text(separator=","), outv]
             lineup.append(player)
         raw_box_data['tables'].append(lineup)
-    return format_records(raw_box_data)
+    return raw_box_data
 
-def update_latest_games(datev=None):
+def parse_box_soup(page):
     """
-    Extract the get_box_data stats from a list of games generated by
-    get_latest_games().  Datev is date in yyyymmdd format.  Use today
-    if omitted.
+    Box score parser backend: full html.parser BeautifulSoup tree
     """
-    glist = get_latest_games(datev)
-    if not glist:
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    return soup_box_data(BeautifulSoup(page, "html.parser"))
+
+def parse_box_strained(page):
+    """
+    Box score parser backend: BeautifulSoup tree holding only the tables
+    and spans (where the gametracker rows are)
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from bs4 import BeautifulSoup, SoupStrainer
+    return soup_box_data(BeautifulSoup(page, "html.parser",
+                                       parse_only=SoupStrainer(["table",
+                                                                "span"])))
+
+def parse_box_lxml(page):
+    """
+    Box score parser backend: lxml tree, producing the same raw data as
+    soup_box_data
+    """
+    import lxml.html  # pylint: disable=import-outside-toplevel
+    doc = lxml.html.fromstring(page)
+    raw_box_data = {}
+    tables = list(doc.iter("table"))
+    elements = doc.xpath("//table | //span[contains(concat(' ', "
+                         "normalize-space(@class), ' '), "
+                         f"' {STEAL_CLASS} ')]")
+    raw_box_data['Steals'] = parse_steals(section_spans(
+        elements, tables, lambda entry: "".join(entry.itertext())))
+    frows = list(tables[0].iter("tr"))
+    raw_box_data['visitors'] = ",".join(frows[1].itertext())
+    raw_box_data['home'] = ",".join(frows[2].itertext())
+    raw_box_data['tables'] = []
+    for tnum in range(1, 8, 2):
+        lineup = []
+        for pdata in tables[tnum].iter("tr"):
+            idv = next(pdata.iterfind(".//a[@href]"), None)
+            outv = ''
+            if idv is not None:
+                outv = idv.get('href')
+            lineup.append([",".join(pdata.itertext()), outv])
+        raw_box_data['tables'].append(lineup)
+    return raw_box_data
+
+BOX_PARSERS = {"soup": parse_box_soup, "strained": parse_box_strained,
+               "lxml": parse_box_lxml}
+
+def parse_box_page(page, parser=None):
+    """
+    Extract the raw box score data from the html of a box score page using
+    the parser backend named (BOX_PARSER by default)
+    """
+    return BOX_PARSERS[parser or BOX_PARSER](page)
+
+def box_url(box_id):
+    """
+    Return the url of the box score page for a game id
+    """
+    return cbs_url(f"/{box_id}")
+
+def box_records(page, team_data=None, parser=None):
+    """
+    Given the html of a box score page, return the player stats records
+    """
+    with stage("parse"):
+        records = format_records(parse_box_page(page, parser), team_data)
+    count("records", len(records))
+    return records
+
+def get_box_data(box_id, team_data=None, parser=None):
+    """
+    Given a game id, extract the player info as a dict containing
+    the stats
+    """
+    return box_records(get_page(box_url(box_id)), team_data, parser)
+
+def update_latest_games(datev=None, workers=BOX_SCORE_WORKERS):
+    """
+    Extract the get_box_data stats for the games played on datev and save
+    them in rot{datev}.json.  Datev is date in yyyymmdd format.  Use the
+    last complete day if omitted.
+
+    The day is processed in stages, each fed the output of the one before:
+    discover the day's box scores, filter out games without an AL team,
+    fetch the box scores and write the day file (adding it to the season
+    store).  Nothing is fetched if the day file already exists, unless it
+    was written by refresh_latest_games while some of the day's games were
+    still being played, in which case the day is refreshed instead.
+
+    Box scores are fetched and parsed by a pool of worker threads (one
+    thread reproduces the old sequential behavior).  Results are collected
+    in the order of the game list, so the output file is the same no matter
+    how many workers are used.
+    """
+    gdate = datev if datev else get_last_full_day()
+    if os.path.exists(day_file_path(gdate)):
+        if day_in_progress(gdate):
+            refresh_latest_games(gdate, workers)
+            return
+        print(f"Skipping -- rot{gdate}.json already exists")
         return
-    gdate = glist[0].split("_")[1]
-    out_path = os.sep.join(["..", "data", f"rot{gdate}.json"])
-    if os.path.exists(out_path):
+    team_data = get_team_directory()
+    glist = filter_al_teams_from_boxscores(get_recent_games(gdate), team_data)
+    if not glist:
         return
+    write_day_file(gdate, get_all_box_data(glist, team_data, workers))
+    count("days_written")
+    update_season_store(gdate)
+
+def write_day_file(gdate, all_stats):
+    """
+    Write the stats for a day to rot{gdate}.json, and in columnar form to
+    rot{gdate}.npy.  The files are written under temporary names first so
+    that a partial day file never exists.
+
+    The columnar copy is optional: if the records do not fit it, the day
+    file is still written, and any older rot{gdate}.npy is removed so that
+    it is never read in place of the new day file.
+    """
+    out_path = day_file_path(gdate)
+    tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf8") as write_file:
+        json.dump(all_stats, write_file, indent=0)
+    os.replace(tmp_path, out_path)
+    try:
+        save_day_columns(gdate, all_stats)
+    except ValueError as exc:
+        print(f"No columnar copy of rot{gdate}.json: {exc}")
+        if os.path.exists(columns_path(gdate)):
+            os.remove(columns_path(gdate))
+
+def get_all_box_data(glist, team_data, workers=BOX_SCORE_WORKERS):
+    """
+    Run get_box_data on every game in glist using a pool of worker threads.
+    Return all the player stats, in game list order.
+    """
     all_stats = []
-    for game in glist:
-        stats = get_box_data(game)
+    for stats in get_box_records(glist, team_data, workers):
         print(stats)
         all_stats.extend(stats)
-    with open(out_path, "w", encoding="utf8") as write_file:
-        json.dump(all_stats, write_file, indent=0)
+    return all_stats
+
+def get_box_records(glist, team_data, workers=BOX_SCORE_WORKERS):
+    """
+    Run get_box_data on every game in glist using a pool of worker threads.
+    Return a list of each game's player stats, in game list order.
+    """
+    count("box_scores", len(glist))
+    with stage("box_scores"), ThreadPoolExecutor(max_workers=workers) as \
+            executor:
+        return list(executor.map(partial(get_box_data, team_data=team_data),
+                                 glist))
+
+def game_state_path(gdate):
+    """
+    Return the path of the file tracking the games of gdate for
+    refresh_latest_games
+    """
+    return os.sep.join([GAME_STATE_DIR, f"games{gdate}.json"])
+
+def read_game_states(gdate):
+    """
+    Return the game states saved by refresh_latest_games for gdate (an
+    empty dict if there are none)
+    """
+    if not os.path.exists(game_state_path(gdate)):
+        return {}
+    with open(game_state_path(gdate), "r", encoding="utf8") as fdesc:
+        return json.load(fdesc)
+
+def games_final(gdate):
+    """
+    Return True unless refresh_latest_games last saw some of the games of
+    gdate still being played
+    """
+    return all(state["final"] for state in read_game_states(gdate).values())
+
+def day_in_progress(gdate):
+    """
+    Return True if some of the games of gdate were still being played when
+    refresh_latest_games last looked.  A postponed or suspended game never
+    goes final, so a day also stops being in progress once the day file
+    of a later day holds only final games; such games are left out.
+    """
+    if games_final(gdate):
+        return False
+    return not any(later > gdate and games_final(later)
+                   for later in list_dates(DATA_DIR, "rot"))
+
+def refresh_latest_games(datev=None, workers=BOX_SCORE_WORKERS):
+    """
+    Incremental version of update_latest_games for a day whose games are
+    still being played (or a day file that was written too early).  Datev
+    is a date in yyyymmdd format and defaults to today.
+
+    The state of each of the day's games (final or not), and the stats of
+    the final ones, are kept in data/games/games{datev}.json.  Every call
+    reads the scoreboard and only fetches the box scores of games that
+    have gone final since the last call.  If there are any, rot{datev}.json
+    is rewritten in place with the stats of every final game so far.  A
+    day file written before its games were tracked is rebuilt from all of
+    its final games on the first call.
+
+    Returns:
+        number of box scores fetched
+    """
+    gdate = datev if datev else datetime.today().strftime("%Y%m%d")
+    team_data = get_team_directory()
+    states = get_game_states(gdate)
+    glist = filter_al_teams_from_boxscores(list(states), team_data)
+    known = read_game_states(gdate)
+    changed = [game for game in glist
+               if states[game] and not known.get(game, {}).get("final")]
+    for game, records in zip(changed, get_box_records(changed, team_data,
+                                                      workers)):
+        known[game] = {"final": True, "records": records}
+    for game in glist:
+        if game not in known:
+            known[game] = {"final": False, "records": []}
+    os.makedirs(GAME_STATE_DIR, exist_ok=True)
+    tmp_path = (f"{game_state_path(gdate)}.{os.getpid()}."
+                f"{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf8") as fdesc:
+        json.dump(known, fdesc)
+    os.replace(tmp_path, game_state_path(gdate))
+    if changed:
+        all_stats = []
+        for game in glist:
+            all_stats.extend(known[game]["records"])
+        write_day_file(gdate, all_stats)
+        update_season_store(gdate)
+    return len(changed)
+
+def rebuild_day_files():
+    """
+    Regenerate every existing rot{date}.json file from the pages saved in
+    the page cache.  No network requests are made, so this can be rerun
+    over a whole season after a parser fix.  Days with pages missing from
+    the cache are left as they are.
+    """
+    data_dir = os.sep.join(["..", "data"])
+    set_offline(True)
+    try:
+        team_data = get_team_directory()
+        for fname in sorted(os.listdir(data_dir)):
+            if not (fname.startswith("rot") and fname.endswith(".json")):
+                continue
+            gdate = fname[3:-5]
+            try:
+                glist = filter_al_teams_from_boxscores(
+                    get_recent_games(gdate, force=True), team_data)
+                all_stats = get_all_box_data(glist, team_data)
+            except PageNotCached as exc:
+                print(f"Skipping {fname} -- page not cached: {exc}")
+                continue
+            write_day_file(gdate, all_stats)
+        rebuild_season_store()
+    finally:
+        set_offline(False)
 
 if __name__ == "__main__":
     update_latest_games()
@@ -0,0 +1,253 @@
+# Cbssportsline Rotiserrie league extraction code
+# Copyright (c) 2022 Warren Usui
+# This code is licensed under the MIT license (see LICENSE.txt for details)
+"""
+Shared web page fetching code.  Does not require logging in.
+
+Requests made to the same host are spaced at least MIN_HOST_INTERVAL
+seconds apart so that several threads can fetch pages at once without
+hammering the server.
+
+All requests share one pooled Session (keep-alive connections, a timeout
+and retries with backoff for connection errors and server errors).  The
+session, and requests itself, are only loaded when the first request is
+made.
+
+Every page fetched is also saved (gzipped) in data/pages under a name
+derived from a hash of its url, along with its ETag and Last-Modified
+headers.  Pages already in the cache are requested conditionally, so an
+unchanged page comes back as a cheap 304 and the saved copy is used.  In
+offline mode pages are read from the cache and no network requests are
+made, which allows all of the day files to be rebuilt locally after a
+parser change.
+"""
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse
+from run_stats import cache_result, record_request
+
+CBS_SITE = {"url": "https://www.cbssports.com"}
+MIN_HOST_INTERVAL = 0.2
+REQUEST_TIMEOUT = (5, 30)
+REQUEST_RETRIES = 3
+RETRY_BACKOFF = 0.5
+POOL_SIZE = 16
+PAGE_CACHE_DIR = os.sep.join(["..", "data", "pages"])
+PAGE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+PAGE_CACHE_MAX_AGE = 400 * 24 * 60 * 60
+CACHE_SETTINGS = {"offline": False}
+
+class PageNotCached(Exception):
+    """
+    Thrown in offline mode when a page that was never downloaded is
+    requested
+    """
+
+class HostRateLimiter:
+    """
+    Thread safe per-host rate limiter.  Each call to wait() reserves the
+    next free time slot for the url's host and sleeps until it arrives.
+    """
+    def __init__(self, interval=MIN_HOST_INTERVAL):
+        self.interval = interval
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        """
+        Block until a request to the host of url is allowed
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+RATE_LIMITER = HostRateLimiter()
+
+def make_session():
+    """
+    Return a requests Session with a connection pool large enough for the
+    fetching threads and a retry policy for failed requests
+    """
+    # pylint: disable=import-outside-toplevel
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    retries = Retry(total=REQUEST_RETRIES, backoff_factor=RETRY_BACKOFF,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE,
+                          max_retries=retries)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+SESSION = {}
+SESSION_LOCK = threading.Lock()
+
+def get_session():
+    """
+    Return the shared session, creating it on first use
+    """
+    with SESSION_LOCK:
+        if "session" not in SESSION:
+            SESSION["session"] = make_session()
+        return SESSION["session"]
+
+def cbs_url(path):
+    """
+    Return the url of path on the cbssports site.  CBS_SITE can be pointed
+    at a local stand-in server for testing.
+    """
+    return f"{CBS_SITE['url']}{path}"
+
+def set_offline(offline):
+    """
+    Turn offline mode (pages only come from the page cache) on or off
+    """
+    CACHE_SETTINGS["offline"] = offline
+
+def cache_path(url):
+    """
+    Return the page cache file name used for url
+    """
+    key = hashlib.sha256(url.encode("utf8")).hexdigest()
+    return os.sep.join([PAGE_CACHE_DIR, f"{key}.html.gz"])
+
+def validators_path(url):
+    """
+    Return the file name used for the ETag and Last-Modified values of url
+    """
+    return cache_path(url).replace(".html.gz", ".meta")
+
+def read_cached_page(url):
+    """
+    Return the cached text of url, or None if it has not been saved
+    """
+    path = cache_path(url)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf8") as fdesc:
+        return fdesc.read()
+
+def save_cached_page(url, text, headers=None):
+    """
+    Save the text of url in the page cache, along with the validators
+    found in the response headers.  Files are written under temporary
+    names first so that readers never see a partial page.
+    """
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    path = cache_path(url)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf8") as fdesc:
+        fdesc.write(text)
+    os.replace(tmp_path, path)
+    validators = {}
+    if headers:
+        validators = {key: headers[key] for key in ["ETag", "Last-Modified"]
+                      if key in headers}
+    tmp_path = f"{validators_path(url)}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf8") as fdesc:
+        json.dump(validators, fdesc)
+    os.replace(tmp_path, validators_path(url))
+
+def conditional_headers(url):
+    """
+    Return the If-None-Match and If-Modified-Since headers to send for
+    url (none unless the page is in the cache)
+    """
+    if not (os.path.exists(cache_path(url)) and
+            os.path.exists(validators_path(url))):
+        return {}
+    with open(validators_path(url), "r", encoding="utf8") as fdesc:
+        validators = json.load(fdesc)
+    headers = {}
+    if "ETag" in validators:
+        headers["If-None-Match"] = validators["ETag"]
+    if "Last-Modified" in validators:
+        headers["If-Modified-Since"] = validators["Last-Modified"]
+    return headers
+
+def get_page(url):
+    """
+    Return the text of the web page at url.
+
+    Online, the host's rate limit is honored and the page is requested
+    through the shared session (conditionally if it is cached).  A 304
+    response returns the cached copy; a new page is saved in the cache.
+    Offline, the page is read from the cache and PageNotCached is raised
+    if it is not there.
+    """
+    if CACHE_SETTINGS["offline"]:
+        text = read_cached_page(url)
+        cache_result("pages", text is not None)
+        if text is None:
+            raise PageNotCached(url)
+        return text
+    resp = timed_get(url, conditional_headers(url))
+    if resp.status_code == 304:
+        text = read_cached_page(url)
+        if text is not None:
+            cache_result("pages", True)
+            os.utime(cache_path(url))
+            return text
+        resp = timed_get(url, {})
+    cache_result("pages", False)
+    if resp.status_code == 200:
+        save_cached_page(url, resp.text, resp.headers)
+    return resp.text
+
+def timed_get(url, headers):
+    """
+    Request url through the shared session (after waiting for the rate
+    limiter) and record the request in the run statistics
+    """
+    RATE_LIMITER.wait(url)
+    start = time.perf_counter()
+    resp = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    record_request(url, len(resp.content), time.perf_counter() - start,
+                   resp.status_code)
+    return resp
+
+def evict_pages(max_bytes=PAGE_CACHE_MAX_BYTES, max_age=PAGE_CACHE_MAX_AGE):
+    """
+    Trim the page cache.  Pages older than max_age seconds are removed,
+    then the oldest remaining pages are removed until the cache uses no
+    more than max_bytes.
+    """
+    if not os.path.isdir(PAGE_CACHE_DIR):
+        return
+    now = time.time()
+    pages = []
+    for fname in os.listdir(PAGE_CACHE_DIR):
+        if not fname.endswith(".html.gz"):
+            continue
+        path = os.sep.join([PAGE_CACHE_DIR, fname])
+        fstat = os.stat(path)
+        if now - fstat.st_mtime > max_age:
+            remove_cached_page(path)
+        else:
+            pages.append((fstat.st_mtime, fstat.st_size, path))
+    total = sum(page[1] for page in pages)
+    for _, size, path in sorted(pages):
+        if total <= max_bytes:
+            break
+        remove_cached_page(path)
+        total -= size
+
+def remove_cached_page(path):
+    """
+    Remove a page cache file and its validators file
+    """
+    os.remove(path)
+    meta_path = path.replace(".html.gz", ".meta")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)